@@ -1,6 +1,7 @@
 import pandas as pd
 import os
 from logger_config import logger
+from save_data import USE_DB
 
 def load_csv(file_path):
     if not os.path.exists(file_path):
@@ -52,9 +53,26 @@ def main(file_path):
     save_csv(df, file_path)
     logger.info("Google Maps links have been added to the CSV file.")
 
+def main_db():
+    """Set the link column in the result database, touching only rows whose link changed."""
+    from result_db import read_rows, update_listings
+
+    rows = read_rows(where="Latitude != '' AND Longitude != ''")
+    updates = [(row, {'link': create_google_maps_link(row['Latitude'], row['Longitude'], row['Full_Address'])})
+               for row in rows]
+    changed = update_listings(updates)
+    logger.info(f"Google Maps links updated for {changed} of {len(rows)} rows in the result database.")
+
+def add_links(file_path):
+    """Add Google Maps links in whichever result backend RESULT selects."""
+    if USE_DB:
+        main_db()
+    else:
+        main(file_path)
+
 if __name__ == "__main__":
     file_path = 'results/results.csv'
 
     logger.info("Starting Google Maps link addition process")
-    main(file_path)
+    add_links(file_path)
     logger.info("Google Maps link addition process completed")
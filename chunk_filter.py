@@ -0,0 +1,107 @@
+import os
+import re
+import random
+import threading
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+FILTER_ENABLED = os.getenv('CHUNK_FILTER', 'true').lower() == 'true'
+FILTER_THRESHOLD = float(os.getenv('CHUNK_FILTER_THRESHOLD', 3.0))
+# Share of dropped chunks still sent to the LLM to measure what the filter loses
+FILTER_AUDIT_RATE = float(os.getenv('CHUNK_FILTER_AUDIT_RATE', 0.0))
+
+# (pattern, weight per match, matches counted at most)
+LISTING_SIGNALS = {
+    'price': (re.compile(
+        r'[$€£¥₹]\s?\d[\d,]*(\.\d+)?|\b\d[\d,]*(\.\d+)?\s?(usd|eur|gbp|cad|aud|inr|dollars?)\b', re.IGNORECASE), 2.0, 5),
+    'beds': (re.compile(
+        r'\b(\d+(\.\d+)?|one|two|three|four|five)\s*-?\s*(bed|beds|bedroom|bedrooms|bd|bds|br)\b|\bstudio\b', re.IGNORECASE), 1.5, 5),
+    'baths': (re.compile(
+        r'\b(\d+(\.\d+)?|one|two|three)\s*-?\s*(bath|baths|bathroom|bathrooms|ba)\b', re.IGNORECASE), 1.5, 5),
+    'area': (re.compile(
+        r'\b\d[\d,]*(\.\d+)?\s*(sq\.?\s?ft|sqft|square\s+feet|ft²|sq\.?\s?m|m²|square\s+met(er|re)s)', re.IGNORECASE), 1.0, 3),
+    'address': (re.compile(
+        r'\b\d{1,6}\s+([A-Za-z0-9.\'-]+\s+){1,4}(st|street|ave|avenue|rd|road|blvd|boulevard|dr|drive|ln|lane|way|'
+        r'ct|court|pl|place|pkwy|parkway|ter|terrace|cir|circle|hwy|highway)\b\.?', re.IGNORECASE), 1.0, 3),
+    'availability': (re.compile(
+        r'\b(available|availability|vacancy|vacant|move[\s-]in|lease|per\s+(month|night|week)|/\s?(mo|month|night|nt)\b|'
+        r'sold\s+out|waitlist|book\s+now|reserve|check[\s-]in)', re.IGNORECASE), 0.5, 4),
+}
+
+_stats = {
+    'pages': 0,
+    'chunks': 0,
+    'dropped': 0,
+    'audited': 0,
+    'audited_with_records': 0,
+    'missed_records': 0,
+}
+_stats_lock = threading.Lock()
+
+
+def score_chunk(chunk):
+    """Weighted, capped count of listing signals in a chunk of page text."""
+    score = 0.0
+    for pattern, weight, cap in LISTING_SIGNALS.values():
+        matches = 0
+        for _ in pattern.finditer(chunk):
+            matches += 1
+            if matches == cap:
+                break
+        score += matches * weight
+    return score
+
+
+def filter_chunks(chunks):
+    """Split chunks into the ones worth sending to the LLM and a sample of the
+    dropped ones to audit. The best-scoring chunk is always kept, so a page
+    with weak signals still gets one call."""
+    if not FILTER_ENABLED or len(chunks) < 2:
+        return list(chunks), []
+
+    scores = [score_chunk(chunk) for chunk in chunks]
+    best = max(range(len(chunks)), key=lambda i: scores[i])
+    kept = [chunk for i, chunk in enumerate(chunks) if scores[i] >= FILTER_THRESHOLD or i == best]
+    dropped = [chunk for i, chunk in enumerate(chunks) if scores[i] < FILTER_THRESHOLD and i != best]
+    audited = [chunk for chunk in dropped if random.random() < FILTER_AUDIT_RATE]
+
+    with _stats_lock:
+        _stats['pages'] += 1
+        _stats['chunks'] += len(chunks)
+        _stats['dropped'] += len(dropped)
+    if dropped:
+        logger.info(
+            f"Chunk filter dropped {len(dropped)}/{len(chunks)} chunks below {FILTER_THRESHOLD} "
+            f"(scores: {', '.join(f'{score:.1f}' for score in scores)})"
+        )
+    return kept, audited
+
+
+def record_audit(missed_records):
+    """Count what the LLM found in an audited dropped chunk that no kept chunk produced."""
+    with _stats_lock:
+        _stats['audited'] += 1
+        _stats['audited_with_records'] += bool(missed_records)
+        _stats['missed_records'] += len(missed_records)
+    if missed_records:
+        logger.warning(f"Chunk filter dropped a chunk holding {len(missed_records)} records the kept chunks missed")
+
+
+def get_filter_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def log_filter_report():
+    stats = get_filter_stats()
+    if not stats['chunks']:
+        return
+    dropped = stats['dropped'] / stats['chunks'] * 100
+    logger.info(f"Chunk filter: dropped {stats['dropped']}/{stats['chunks']} chunks ({dropped:.0f}%) over {stats['pages']} pages")
+    if stats['audited']:
+        logger.info(
+            f"Chunk filter audit: {stats['audited_with_records']}/{stats['audited']} dropped chunks held "
+            f"{stats['missed_records']} records the kept chunks missed"
+        )
@@ -1,60 +1,376 @@
 import os
+import json
 import time
-import google.generativeai as genai
-from groq import Groq
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from logger_config import logger
+from llm_cache import cache_key, get_cached_response, store_response
+from rate_limiter import RateLimited, acquire, estimate_tokens, backoff_delay, report_rate_limited, COMPLETION_TOKEN_ESTIMATE
+from provider_health import allow_call, record_success, record_failure, hedge_delay, record_hedge, record_repair
+from schemas import parse_and_validate, to_gemini_schema
+from llm_metrics import note_usage, take_usage, record_call, record_cache_hit
 
 load_dotenv()
 
-GROQ_CLIENT = Groq(api_key=os.getenv("GROQ_API_KEY"))
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+# Provider SDKs are imported on first use so only the configured ones are loaded
+_groq_client = None
+_gemini_models = {}
+_clients_lock = threading.Lock()
 
-def connect_to_groq(prompt, user_content):
+# Calls in flight per provider, shared by every worker and chunk thread
+PROVIDER_CONCURRENCY = {
+    "groq": int(os.getenv("GROQ_MAX_CONCURRENCY", 4)),
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY", 4)),
+}
+_provider_slots = {provider: threading.BoundedSemaphore(limit) for provider, limit in PROVIDER_CONCURRENCY.items()}
+
+# Retries after a 429 before the call is given up
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("AI_MAX_RETRIES", 3))
+
+# Also ask the next provider once the first is slower than its p95 latency
+AI_HEDGE = os.getenv("AI_HEDGE", "false").lower() == "true"
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("AI_HEDGE_THREADS", 32)), thread_name_prefix="ai-hedge")
+
+# Ask providers for JSON output natively when a call has a schema
+AI_JSON_MODE = os.getenv("AI_JSON_MODE", "true").lower() == "true"
+
+REPAIR_PROMPT = (
+    "Your previous reply did not match the required JSON format. Return the corrected JSON only, "
+    "keeping the same content, with no explanations."
+)
+
+def get_groq_client():
+    """One Groq client per process, so every call shares its HTTP connection pool."""
+    global _groq_client
+    with _clients_lock:
+        if _groq_client is None:
+            from groq import Groq
+            _groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        return _groq_client
+
+def get_gemini_model(model_name):
+    with _clients_lock:
+        if model_name not in _gemini_models:
+            import google.generativeai as genai
+            if not _gemini_models:
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _gemini_models[model_name] = genai.GenerativeModel(model_name)
+        return _gemini_models[model_name]
+
+def connect_to_groq(prompt, user_content, schema=None):
     logger.info("Initiating Groq AI connection")
+    from groq import RateLimitError as GroqRateLimitError
     try:
         messages = [
             {"role": "system", "content": prompt},
             {"role": "user", "content": user_content}
         ]
-        response = GROQ_CLIENT.chat.completions.create(model=os.getenv("GROQ_MODEL"), messages=messages)
+        options = {"response_format": {"type": "json_object"}} if schema and AI_JSON_MODE else {}
+        response = get_groq_client().chat.completions.create(model=os.getenv("GROQ_MODEL"), messages=messages, **options)
         if response and response.choices:
             logger.info("Successfully received Groq AI response")
+            if response.usage:
+                note_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
             logger.debug(f"Response: {response.choices[0].message.content[:100]}...")
             return response.choices[0].message.content
         else:
             logger.warning("Groq AI returned an empty or invalid response")
             return None
+    except GroqRateLimitError as e:
+        raise RateLimited(str(e), e.response.headers.get("retry-after"))
     except Exception as e:
         logger.error(f"Error during Groq AI connection: {str(e)}")
         return None
 
-def connect_to_gemini(prompt, user_content):
+def connect_to_gemini(prompt, user_content, schema=None):
     logger.info("Initiating Gemini AI connection")
+    from google.api_core.exceptions import ResourceExhausted
     try:
-        model = genai.GenerativeModel(os.getenv("GEMINI_MODEL"))
-        response = model.generate_content([prompt, user_content])
+        model = get_gemini_model(os.getenv("GEMINI_MODEL"))
+        options = {}
+        if schema and AI_JSON_MODE:
+            options["generation_config"] = {
+                "response_mime_type": "application/json",
+                "response_schema": to_gemini_schema(schema),
+            }
+        response = model.generate_content([prompt, user_content], **options)
         if response and response.text:
             logger.info("Successfully received Gemini AI response")
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                note_usage(usage.prompt_token_count, usage.candidates_token_count)
             logger.debug(f"Response: {response.text[:100]}...")
             return response.text
         else:
             logger.warning("Gemini AI returned an empty or invalid response")
             return None
+    except ResourceExhausted as e:
+        raise RateLimited(str(e))
     except Exception as e:
         logger.error(f"Error during Gemini AI connection: {str(e)}")
         return None
 
-def connect_to_ai(prompt, user_content):
-    logger.info("Initiating AI connection")
-    time.sleep(5)
-    ai_provider = os.getenv("AI_PROVIDER", "groq").lower()
-    
-    if ai_provider == "groq":
-        return connect_to_groq(prompt, user_content)
-    elif ai_provider == "gemini":
-        return connect_to_gemini(prompt, user_content)
+PROVIDERS = {
+    "groq": (connect_to_groq, "GROQ_MODEL"),
+    "gemini": (connect_to_gemini, "GEMINI_MODEL"),
+}
+
+def call_provider(provider, prompt, user_content, schema=None):
+    """Call one provider within its quota, backing off and retrying on 429s."""
+    connect, model_env = PROVIDERS[provider]
+    model = os.getenv(model_env)
+    tokens = estimate_tokens(prompt, user_content)
+    queue_wait = 0.0
+    take_usage()
+
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        waiting_since = time.monotonic()
+        acquire(provider, model, tokens)
+        try:
+            with _provider_slots[provider]:
+                started = time.monotonic()
+                queue_wait += started - waiting_since
+                response = connect(prompt, user_content, schema)
+            latency = time.monotonic() - started
+            usage = take_usage()
+            if usage:
+                record_call(provider, model, usage[0], usage[1], latency, queue_wait, ok=bool(response))
+            else:
+                record_call(
+                    provider, model, (len(prompt) + len(user_content)) // 4, len(response or "") // 4,
+                    latency, queue_wait, ok=bool(response), estimated=True,
+                )
+            return response
+        except RateLimited as e:
+            if attempt == MAX_RATE_LIMIT_RETRIES:
+                logger.error(f"{provider} still rate limited after {attempt + 1} attempts: {e}")
+                return None
+            report_rate_limited(provider, model, backoff_delay(attempt, e.retry_after))
+    return None
+
+def get_provider_order():
+    """Providers to try in order: AI_PROVIDERS if set, else AI_PROVIDER followed
+    by the other providers that have an API key configured."""
+    configured = os.getenv("AI_PROVIDERS")
+    if configured:
+        names = [name.strip().lower() for name in configured.split(",") if name.strip()]
     else:
-        logger.error(f"Unknown AI provider: {ai_provider}")
+        primary = os.getenv("AI_PROVIDER", "groq").lower()
+        names = [primary] + [name for name in PROVIDERS if name != primary and os.getenv(f"{name.upper()}_API_KEY")]
+
+    order = []
+    for name in names:
+        if name not in PROVIDERS:
+            logger.error(f"Unknown AI provider: {name}")
+        elif name not in order:
+            order.append(name)
+    return order
+
+def conform_to_schema(provider, response, schema):
+    """Return ``response`` as canonical JSON matching ``schema``, after at most
+    one repair round-trip that sends the provider its reply and the errors
+    but not the original page content."""
+    value, errors = parse_and_validate(response, schema)
+    if not errors:
+        return json.dumps(value, ensure_ascii=False)
+
+    logger.warning(f"{provider} reply does not match the schema: {'; '.join(errors[:5])}")
+    repair_content = (
+        f"Required JSON schema: {json.dumps(schema)}\n\n"
+        f"Your reply:\n{response}\n\n"
+        "Problems:\n" + "\n".join(f"- {error}" for error in errors[:20])
+    )
+    repaired = call_provider(provider, REPAIR_PROMPT, repair_content, schema)
+    value, errors = parse_and_validate(repaired, schema) if repaired else (None, ["no reply"])
+    record_repair(provider, not errors)
+    if errors:
+        logger.warning(f"{provider} repair failed: {'; '.join(errors[:5])}")
+        return None
+    logger.info(f"{provider} reply repaired")
+    return json.dumps(value, ensure_ascii=False)
+
+def timed_call(provider, prompt, user_content, is_valid, schema=None):
+    """Call a provider and record the outcome against its health. Missing or malformed
+    replies count as failures; a well-formed reply failing ``is_valid`` (e.g. status -1)
+    is returned as None so the caller fails over, without marking the provider unhealthy."""
+    start = time.monotonic()
+    try:
+        response = call_provider(provider, prompt, user_content, schema)
+        if response and schema:
+            response = conform_to_schema(provider, response, schema)
+    except Exception as e:
+        logger.error(f"{provider} call failed: {e}")
+        response = None
+    latency = time.monotonic() - start
+
+    if response and (is_valid is None or is_valid(response)):
+        record_success(provider, latency)
+        logger.info(f"AI call served by {provider} in {latency:.2f}s")
+        return response
+    if response and schema:
+        record_success(provider, latency)
+        logger.warning(f"{provider} answered without a usable result after {latency:.2f}s")
+        return None
+    record_failure(provider)
+    logger.warning(f"{provider} returned no usable response after {latency:.2f}s")
+    return None
+
+def route_call(providers, prompt, user_content, is_valid=None, schema=None):
+    """Try providers in order, skipping ones whose circuit is open, and with
+    AI_HEDGE also start the next provider when the current one runs past its
+    p95 latency. Returns (provider, response) for the first usable answer."""
+    remaining = list(providers)
+    call_args = (prompt, user_content, is_valid, schema)
+
+    def next_allowed():
+        while remaining:
+            provider = remaining.pop(0)
+            if allow_call(provider):
+                return provider
+            logger.info(f"Skipping {provider}, its circuit is open")
         return None
+
+    first = next_allowed()
+    if first is None:
+        # Every circuit is open; trying the primary beats failing outright
+        first = providers[0]
+    if not AI_HEDGE:
+        provider = first
+        while provider:
+            response = timed_call(provider, *call_args)
+            if response:
+                return provider, response
+            provider = next_allowed()
+        return None, None
+
+    def submit(provider):
+        # Carry the caller's site/stage context into the hedge thread
+        return _hedge_executor.submit(contextvars.copy_context().run, timed_call, provider, *call_args)
+
+    pending = {submit(first): first}
+    hedged_from = None
+    while pending:
+        timeout = None
+        if hedged_from is None and len(pending) == 1 and remaining:
+            timeout = hedge_delay(first)
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            backup = next_allowed()
+            if backup:
+                hedged_from = first
+                logger.info(f"{first} slower than {timeout:.2f}s, hedging with {backup}")
+                pending[submit(backup)] = backup
+            else:
+                hedged_from = ""
+            continue
+
+        for future in done:
+            provider = pending.pop(future)
+            response = future.result()
+            if response:
+                if hedged_from:
+                    record_hedge(hedged_from, provider != hedged_from)
+                return provider, response
+        if not pending:
+            provider = next_allowed()
+            if provider:
+                pending[submit(provider)] = provider
+    if hedged_from:
+        record_hedge(hedged_from, False)
+    return None, None
+
+def get_cached_reply(providers, prompt, user_content, schema=None, cache_if=None):
+    """Cached reply for this prompt from any of ``providers``, parsed when a schema is given.
+    Entries failing ``cache_if`` (stored before the predicate applied) are not replayed."""
+    for index, provider in enumerate(providers):
+        key = cache_key(provider, os.getenv(PROVIDERS[provider][1]), prompt, user_content)
+        cached = get_cached_response(key, record_miss=index == len(providers) - 1)
+        if not cached or (cache_if and not cache_if(cached)):
+            continue
+        if not schema:
+            record_cache_hit(provider, os.getenv(PROVIDERS[provider][1]))
+            return cached
+        value, errors = parse_and_validate(cached, schema)
+        if not errors:
+            record_cache_hit(provider, os.getenv(PROVIDERS[provider][1]))
+            return value
+    return None
+
+def store_reply(provider, prompt, user_content, response):
+    model = os.getenv(PROVIDERS[provider][1])
+    tokens = estimate_tokens(prompt, user_content) - COMPLETION_TOKEN_ESTIMATE + len(response) // 4
+    store_response(cache_key(provider, model, prompt, user_content), provider, model, response, tokens)
+
+def connect_to_ai(prompt, user_content, use_cache=True, refresh=False, cache_if=None, schema=None):
+    """Ask the configured providers, reading through the LLM response cache.
+
+    ``use_cache=False`` bypasses the cache entirely, ``refresh=True`` skips the
+    lookup but stores the new answer, and ``cache_if`` is a predicate a
+    response must pass to be stored or replayed (e.g. schemas.has_success_status);
+    a response failing it also makes the call fail over to the next provider.
+
+    With a ``schema`` (see schemas.py) providers are asked for native JSON
+    output, replies are validated and repaired once if needed, and the
+    parsed object is returned instead of the reply text.
+    """
+    logger.info("Initiating AI connection")
+    providers = get_provider_order()
+    if not providers:
+        logger.error("No usable AI provider configured")
+        return None
+
+    if use_cache and not refresh:
+        cached = get_cached_reply(providers, prompt, user_content, schema, cache_if)
+        if cached:
+            return cached
+
+    provider, response = route_call(providers, prompt, user_content, cache_if, schema)
+    if use_cache and response:
+        store_reply(provider, prompt, user_content, response)
+    if schema and response:
+        return json.loads(response)
+    return response
+
+def self_test():
+    """Check that replies without status 1 are neither cached nor replayed, and fail over."""
+    import tempfile
+    import llm_cache
+    from provider_health import get_health
+    from schemas import ROOM_LINK_SCHEMA, has_success_status
+
+    not_found = json.dumps({"status": -1, "message": "Could not read the page", "url": None})
+    found = json.dumps({"status": 1, "message": "Found", "url": "https://example.com/rooms"})
+    replies = {"groq": not_found, "gemini": not_found}
+    calls = []
+
+    def fake(provider):
+        def connect(prompt, user_content, schema=None):
+            calls.append(provider)
+            return replies[provider]
+        return connect
+
+    os.environ.update({"AI_PROVIDERS": "groq,gemini", "GROQ_MODEL": "test-groq", "GEMINI_MODEL": "test-gemini"})
+    for name in ("groq", "gemini"):
+        PROVIDERS[name] = (fake(name), PROVIDERS[name][1])
+
+    with tempfile.TemporaryDirectory() as directory:
+        llm_cache.CACHE_PATH = os.path.join(directory, "llm_cache.sqlite")
+
+        def ask(content):
+            return connect_to_ai("Find the room page", content, cache_if=has_success_status, schema=ROOM_LINK_SCHEMA)
+
+        assert ask("page one") is None and calls == ["groq", "gemini"], calls
+        assert ask("page one") is None and len(calls) == 4, "a -1 reply was replayed from the cache"
+
+        # An entry cached before the status check existed is skipped too
+        store_reply("groq", "Find the room page", "page two", not_found)
+        replies["gemini"] = found
+        assert ask("page two")["url"] == "https://example.com/rooms" and calls[-2:] == ["groq", "gemini"], calls
+        assert ask("page two")["url"] == "https://example.com/rooms" and len(calls) == 6, "status 1 reply not cached"
+        assert get_health("groq").consecutive_failures == 0, "a well-formed -1 reply marked groq unhealthy"
+    logger.info("connect_ai self-test passed")
+
+if __name__ == "__main__":
+    self_test()
@@ -0,0 +1,204 @@
+import os
+import csv
+import time
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+# Rewrite the file once superseded row versions outnumber this share of live rows
+COMPACT_RATIO = float(os.getenv('RESULTS_COMPACT_RATIO', 0.5))
+# ...and there are at least this many of them, so small files are not rewritten constantly
+COMPACT_MIN_STALE = int(os.getenv('RESULTS_COMPACT_MIN_STALE', 1000))
+
+
+class CsvStore:
+    """Upsert store over one CSV file.
+
+    Rows live in memory with a hash index on their key. New rows and new
+    versions of existing rows are appended to the file; on load the last
+    version of a key wins, so the file is always a valid record of the
+    data. Superseded versions are dropped by compact(), which rewrites the
+    file once they pile up and at the end of a run. The file is reloaded if
+    something else (e.g. the address processing step) rewrote it.
+    """
+
+    def __init__(self, filepath, fieldnames, key):
+        self.filepath = filepath
+        self.fieldnames = list(fieldnames)
+        self.key = key
+        self.lock = threading.Lock()
+        self.rows = []
+        self.index = {}
+        self.stale = 0
+        self.signature = None
+        self.load()
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        self.rows = []
+        self.index = {}
+        self.stale = 0
+        header = None
+        if os.path.isfile(self.filepath):
+            with open(self.filepath, 'r', newline='', encoding='utf-8') as csvfile:
+                reader = csv.DictReader(csvfile)
+                header = reader.fieldnames
+                for row in reader:
+                    self.put(self.normalize(row))
+        self.signature = self.file_signature()
+        if header is not None and header != self.fieldnames:
+            logger.info(f"Rewriting {self.filepath} with the current columns")
+            self.compact()
+        elif self.stale:
+            logger.info(f"Loaded {self.filepath} with {self.stale} superseded rows")
+
+    def normalize(self, row):
+        return {field: row.get(field, '') for field in self.fieldnames}
+
+    def put(self, row):
+        """Insert or replace ``row`` in memory; returns True if it replaced one."""
+        key = self.key(row)
+        position = self.index.get(key)
+        if position is None:
+            self.index[key] = len(self.rows)
+            self.rows.append(row)
+            return False
+        self.rows[position] = row
+        self.stale += 1
+        return True
+
+    def upsert(self, data):
+        """Merge ``data`` into the store: existing keys are updated, new ones appended."""
+        with self.lock:
+            if self.file_signature() != self.signature:
+                logger.info(f"{self.filepath} changed on disk, reloading")
+                self.load()
+
+            current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            written = []
+            for new_row in data:
+                position = self.index.get(self.key(new_row))
+                if position is not None:
+                    row = self.normalize({**self.rows[position], **new_row})
+                    row['Note'] = 'Data updated successfully'
+                else:
+                    row = self.normalize(new_row)
+                row['Timestamp'] = current_timestamp
+                self.put(row)
+                written.append(row)
+
+            self.append(written)
+            if self.stale >= COMPACT_MIN_STALE and self.stale > len(self.rows) * COMPACT_RATIO:
+                self.compact()
+            return len(written)
+
+    def append(self, rows):
+        if not rows:
+            return
+        new_file = not os.path.isfile(self.filepath)
+        with open(self.filepath, 'a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+        self.signature = self.file_signature()
+
+    def sync(self):
+        """Force the file's appended rows to disk."""
+        with self.lock:
+            if os.path.isfile(self.filepath):
+                with open(self.filepath, 'a', encoding='utf-8') as f:
+                    os.fsync(f.fileno())
+
+    def compact(self):
+        """Rewrite the file with only the latest version of each row."""
+        temp_path = f"{self.filepath}.tmp"
+        with open(temp_path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
+            writer.writeheader()
+            writer.writerows(self.rows)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+        os.replace(temp_path, self.filepath)
+        if self.stale:
+            logger.info(f"Compacted {self.filepath}: dropped {self.stale} superseded rows, {len(self.rows)} remain")
+        self.stale = 0
+        self.signature = self.file_signature()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(filepath, fieldnames, key):
+    path = os.path.abspath(filepath)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = CsvStore(filepath, fieldnames, key)
+        return _stores[path]
+
+
+def compact_stores():
+    """Drop superseded rows from every open store; call at the end of a run."""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        with store.lock:
+            try:
+                if store.file_signature() != store.signature:
+                    store.load()
+                if store.stale:
+                    store.compact()
+            except OSError as e:
+                logger.error(f"Failed to compact {store.filepath}: {e}")
+
+
+def benchmark(total_rows=100000, batch_size=10, update_share=0.2):
+    """Time upserts into a growing store, printing the per-row cost as it grows."""
+    import random
+    import tempfile
+
+    fieldnames = ['URL_Scrapped', 'Website_Address', 'Price', 'Note', 'Timestamp']
+    key = lambda row: (row.get('URL_Scrapped') or '', row.get('Website_Address') or '')
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = CsvStore(os.path.join(directory, 'results.csv'), fieldnames, key)
+        inserted = 0
+        step = max(1, total_rows // 10)
+        next_report = step
+        window_start = time.perf_counter()
+        window_rows = 0
+        while inserted < total_rows:
+            batch = []
+            for _ in range(batch_size):
+                if inserted and random.random() < update_share:
+                    n = random.randrange(inserted)
+                else:
+                    n = inserted
+                    inserted += 1
+                batch.append({'URL_Scrapped': f"https://site{n}.com/rooms", 'Website_Address': f"{n} Main St", 'Price': f"${n}"})
+            store.upsert(batch)
+            window_rows += len(batch)
+            if inserted >= next_report or inserted >= total_rows:
+                next_report += step
+                elapsed = time.perf_counter() - window_start
+                print(f"{len(store.rows):>8} rows: {elapsed / window_rows * 1e6:7.1f} us per upserted row")
+                window_start = time.perf_counter()
+                window_rows = 0
+        start = time.perf_counter()
+        store.compact()
+        print(f"Final compaction of {len(store.rows)} rows: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    benchmark()
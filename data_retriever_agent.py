@@ -1,14 +1,22 @@
 import os
+import re
 import json
-from groq import Groq
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from SimplerLLM.tools.json_helpers import extract_json_from_text
 from logger_config import logger
-from connect_ai import connect_to_ai  # Import the correct function
+from connect_ai import connect_to_ai
+from schemas import ROOM_DATA_SCHEMA, has_success_status
+from request_batcher import get_batcher, should_batch
+from llm_metrics import call_context
+from structured_data import extract_structured_records, is_complete_record
+from text_chunker import chunk_text
+from chunk_filter import filter_chunks, record_audit
 
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Chunks of one page extracted in parallel; provider limits in connect_ai still apply
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", 4))
 
 prompt = """
 
@@ -69,15 +77,9 @@ def extract_data(response):
         return None
     
     try:
-        json_data = extract_json_from_text(response)
-        if not json_data:
-            logger.error("Failed to extract JSON data from AI response")
-            return None
-        
-        data = json_data[0]
-        status = data.get('status')
-        message = data.get('message')
-        extracted_data = data.get('data')
+        status = response.get('status')
+        message = response.get('message')
+        extracted_data = response.get('data')
         
         if status == 1:
             logger.info(f"Data extraction successful: {message}")
@@ -94,16 +96,14 @@ def extract_data(response):
         logger.error(f"Error during data extraction: {str(e)}")
         return None
 
-def chunk_data(data):
+def chunk_data(data, site=None):
     logger.info("Initiating data chunking process")
     if not data:
         logger.warning("No data to chunk")
         return []
     
     try:
-        words = data.split()
-        max_words = int(os.getenv("MAX_WORDS", 1000))  # Default to 1000 if not set
-        chunks = [' '.join(words[i:i+max_words]) for i in range(0, len(words), max_words)]
+        chunks = chunk_text(data, site=site)
         
         logger.info(f"Data chunking completed. Total chunks created: {len(chunks)}")
         return chunks
@@ -111,25 +111,95 @@ def chunk_data(data):
         logger.error(f"Error during data chunking: {str(e)}")
         return []
 
-def retrieve_room_data(data):
-    if not data:
-        logger.warning("No data provided for room retrieval")
+def build_user_content(chunk, hints=None):
+    content = f"Extract the room data from here: {chunk}"
+    if hints:
+        content += (
+            "\n\nStructured data embedded in the page already describes these rooms, but some fields are missing. "
+            f"Use them as hints and complete them from the text: {json.dumps(hints, ensure_ascii=False)}"
+        )
+    return content
+
+def extract_chunk(index, total, chunk, hints=None, refresh=False):
+    logger.info(f"Processing chunk {index} of {total}")
+    user_content = build_user_content(chunk, hints)
+    with call_context(stage="data"):
+        if should_batch(user_content):
+            # Small chunks share a call with chunks from other pages; this blocks until its batch returns
+            response = get_batcher(prompt, ROOM_DATA_SCHEMA, has_success_status).submit(user_content, refresh).result()
+        else:
+            response = connect_to_ai(
+                prompt, user_content, refresh=refresh, cache_if=has_success_status, schema=ROOM_DATA_SCHEMA
+            )
+    if not response:
+        logger.warning(f"No AI response for chunk {index}")
         return []
+    return extract_data(response) or []
+
+def record_key(record):
+    """Identity of a listing across overlapping chunks, ignoring formatting differences."""
+    if not isinstance(record, dict):
+        return json.dumps(record, sort_keys=True, default=str)
+    address = ' '.join(str(record.get('address') or '').lower().replace(',', ' ').split())
+    price = re.sub(r'[^0-9.]', '', str(record.get('price') or ''))
+    return (address, price, str(record.get('beds') or '').strip(), str(record.get('baths') or '').strip())
+
+def merge_chunk_results(chunk_results):
+    """Merge per-chunk records in chunk order, keeping the first copy of a listing."""
+    merged = []
+    seen = set()
+    for records in chunk_results:
+        for record in records:
+            key = record_key(record)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(record)
+    return merged
+
+def retrieve_room_data(data, html=None, refresh=False, site=None):
+    structured = extract_structured_records(html) if html else []
+    # Partial records only serve as hints in the prompt; only complete ones are ever returned
+    complete = [record for record in structured if is_complete_record(record)]
+    if structured and len(complete) == len(structured):
+        logger.info(f"Using {len(structured)} complete structured data records, skipping AI extraction")
+        return structured
 
-    chunked_data = chunk_data(data)
-    result = []
-
-    for index, chunk in enumerate(chunked_data, 1):
-        logger.info(f"Processing chunk {index} of {len(chunked_data)}")
-        
-        response = connect_to_ai(prompt, f"Extract the room data from here: {chunk}")
-        if response:
-            chunk_result = extract_data(response)
-            if chunk_result:
-                result.extend(chunk_result)
-        else:
-            logger.warning(f"No AI response for chunk {index}")
+    if not data:
+        logger.warning("No data provided for room retrieval")
+        return complete
+
+    chunked_data = chunk_data(data, site)
+    if not chunked_data:
+        return complete
+
+    chunked_data, audited = filter_chunks(chunked_data)
+    total = len(chunked_data) + len(audited)
+
+    workers = max(1, min(total, CHUNK_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, extract_chunk, index, total, chunk, structured, refresh)
+            for index, chunk in enumerate(chunked_data + audited, 1)
+        ]
+        chunk_results = []
+        for index, future in enumerate(futures, 1):
+            try:
+                chunk_results.append(future.result())
+            except Exception as e:
+                logger.error(f"Chunk {index} extraction failed: {e}")
+                chunk_results.append([])
+
+    audit_results = chunk_results[len(chunked_data):]
+    result = merge_chunk_results(chunk_results[:len(chunked_data)])
+    found = {record_key(record) for record in result}
+    for records in audit_results:
+        record_audit([record for record in records if record_key(record) not in found])
     
+    if not result and complete:
+        logger.info(f"AI extraction returned nothing, falling back to {len(complete)} complete structured data records")
+        result = complete
+
     logger.info(f"Room data retrieval completed. Total results: {len(result)}")
     
     if result:
@@ -0,0 +1,226 @@
+import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from logger_config import logger
+from page_readiness import install_probe
+from resource_blocker import configure_options, enable_blocking
+
+load_dotenv()
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_path():
+    """Resolve the chromedriver binary once per process."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            from webdriver_manager.chrome import ChromeDriverManager
+            _driver_path = ChromeDriverManager().install()
+            logger.info(f"Resolved chromedriver binary: {_driver_path}")
+        return _driver_path
+
+
+def build_chrome_options():
+    from selenium.webdriver.chrome.options import Options
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--start-minimized")
+    chrome_options.add_argument("--enable-gpu")
+    chrome_options.add_argument("--log-level=3")
+    chrome_options.add_argument("--silent")
+    chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    configure_options(chrome_options)
+    return chrome_options
+
+
+def launch_driver():
+    # Selenium is only imported once a page actually needs a browser
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    service = Service(get_driver_path())
+    driver = webdriver.Chrome(service=service, options=build_chrome_options())
+    install_probe(driver)
+    enable_blocking(driver)
+    return driver
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning(f"Error while quitting browser: {e}")
+
+
+def is_driver_alive(driver):
+    try:
+        driver.execute_script("return 1")
+        return True
+    except Exception:
+        return False
+
+
+class DriverPool:
+    """Bounded, thread-safe pool of warm headless Chrome sessions.
+
+    A worker leases a browser with ``lease()``. Browsers are recycled after
+    ``max_pages`` page loads, or straight away when a lease ends with the
+    browser no longer responding.
+    """
+
+    def __init__(self, size, max_pages):
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages)
+        self._idle = []
+        self._pages = {}
+        self._leased = set()
+        self._closed = False
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Driver pool is shut down")
+                driver = self._idle.pop() if self._idle else None
+            if driver is None:
+                logger.info("Launching new pooled browser")
+                driver = launch_driver()
+                with self._lock:
+                    self._pages[driver] = 0
+            with self._lock:
+                self._leased.add(driver)
+            return driver
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, driver, healthy):
+        try:
+            with self._lock:
+                self._leased.discard(driver)
+                self._pages[driver] = self._pages.get(driver, 0) + 1
+                pages = self._pages[driver]
+                closed = self._closed
+
+            if closed or not healthy or pages >= self.max_pages:
+                reason = "pool shut down" if closed else "crashed" if not healthy else f"served {pages} pages"
+                logger.info(f"Recycling pooled browser ({reason})")
+                with self._lock:
+                    self._pages.pop(driver, None)
+                quit_driver(driver)
+                return
+
+            with self._lock:
+                self._idle.append(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def lease(self):
+        driver = self._acquire()
+        healthy = True
+        try:
+            yield driver
+        except Exception:
+            healthy = is_driver_alive(driver)
+            raise
+        finally:
+            self._release(driver, healthy)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            drivers = list(self._idle)
+            self._idle.clear()
+            for driver in drivers:
+                self._pages.pop(driver, None)
+            leased = len(self._leased)
+
+        for driver in drivers:
+            quit_driver(driver)
+        if leased:
+            logger.warning(f"Driver pool shut down with {leased} browsers still leased; they will quit on release")
+        logger.info(f"Driver pool shut down, closed {len(drivers)} idle browsers")
+
+
+def get_driver_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._closed:
+            size = int(os.getenv('DRIVER_POOL_SIZE', os.getenv('MAX_WORKERS', 5)))
+            max_pages = int(os.getenv('DRIVER_MAX_PAGES', 50))
+            _pool = DriverPool(size, max_pages)
+            logger.info(f"Created driver pool (size: {size}, max_pages: {max_pages})")
+        return _pool
+
+
+def shutdown_driver_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+atexit.register(shutdown_driver_pool)
+
+
+def benchmark(urls, runs=1):
+    """Compare pages per minute for per-call launches against the pool."""
+
+    def per_call(url):
+        driver = launch_driver()
+        try:
+            driver.get(url)
+            return driver.page_source
+        finally:
+            quit_driver(driver)
+
+    def pooled(url):
+        with get_driver_pool().lease() as driver:
+            driver.get(url)
+            return driver.page_source
+
+    results = {}
+    for name, fetch in (("per-call launch", per_call), ("driver pool", pooled)):
+        start = time.perf_counter()
+        for _ in range(runs):
+            for url in urls:
+                fetch(url)
+        elapsed = time.perf_counter() - start
+        results[name] = len(urls) * runs / elapsed * 60
+        logger.info(f"{name}: {results[name]:.1f} pages/minute")
+    shutdown_driver_pool()
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import functools
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    fixture_dir = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp()
+    if len(sys.argv) == 1:
+        for i in range(10):
+            with open(os.path.join(fixture_dir, f"page-{i}.html"), "w") as f:
+                f.write(f"<html><body><h1>Fixture {i}</h1><a href='/rooms'>Rooms</a></body></html>")
+
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=fixture_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    pages = sorted(name for name in os.listdir(fixture_dir) if name.endswith(".html"))
+    fixture_urls = [f"http://127.0.0.1:{server.server_port}/{name}" for name in pages]
+    benchmark(fixture_urls)
+    server.shutdown()
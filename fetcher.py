@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import time
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from logger_config import logger
+from url_utils import get_site
+from chunk_filter import score_chunk
+from page_parser import ParsedPage
+from page_cache import get_cached_page, store_page, get_cache_mode
+
+load_dotenv()
+
+TIERS_FILE = os.getenv('FETCH_TIERS_FILE', os.path.join('cache', 'fetch_tiers.json'))
+# 'auto' tries plain HTTP first and escalates; 'static' or 'browser' force one tier
+FETCH_TIER = os.getenv('FETCH_TIER', 'auto').lower()
+STATIC_TIMEOUT = float(os.getenv('STATIC_FETCH_TIMEOUT', 15))
+MIN_ANCHORS = int(os.getenv('STATIC_MIN_ANCHORS', 5))
+MIN_TEXT_WORDS = int(os.getenv('STATIC_MIN_TEXT_WORDS', 100))
+# Listing signal score (prices, beds, addresses, ...) static text needs; 0 disables the check
+MIN_LISTING_SCORE = float(os.getenv('STATIC_MIN_LISTING_SCORE', 2.0))
+TIER_TTL = float(os.getenv('FETCH_TIER_TTL_DAYS', 7)) * 86400
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+ANCHOR_PATTERN = re.compile(r'<a\s[^>]*href\s*=', re.IGNORECASE)
+NON_CONTENT_PATTERN = re.compile(r'<(script|style|noscript|template)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+# Empty mount points left behind by client-side rendered apps
+SPA_SHELL_PATTERNS = [
+    re.compile(r'<div[^>]+id=["\'](root|app|__nuxt|__next|svelte)["\'][^>]*>\s*</div>', re.IGNORECASE),
+    re.compile(r'<app-root[^>]*>\s*</app-root>', re.IGNORECASE),
+]
+# Visible (non-noscript) text asking for JavaScript
+JAVASCRIPT_REQUIRED_PATTERN = re.compile(r'(enable|requires?) javascript', re.IGNORECASE)
+
+_local = threading.local()
+_tiers = None
+_tiers_lock = threading.Lock()
+
+
+def get_session():
+    """One keep-alive session per worker thread, pooling connections per host."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        pool_size = int(os.getenv('MAX_WORKERS', 5))
+        adapter = HTTPAdapter(pool_connections=pool_size * 4, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+def load_tiers():
+    global _tiers
+    if _tiers is None:
+        try:
+            with open(TIERS_FILE, 'r', encoding='utf-8') as f:
+                _tiers = json.load(f)
+            logger.info(f"Loaded fetch tiers for {len(_tiers)} page patterns")
+        except FileNotFoundError:
+            _tiers = {}
+        except Exception as e:
+            logger.error(f"Failed to load fetch tiers, starting fresh: {e}")
+            _tiers = {}
+    return _tiers
+
+
+def tier_key(url, room_page=False):
+    """Site plus page pattern, so a static home page does not decide the tier of
+    room or listing pages: "site/" for the root, "site/rooms/*" for pages under
+    /rooms/, "site/*" for other top-level pages. Room pages get their own entries."""
+    try:
+        segments = [segment for segment in urlsplit(url).path.lower().split('/') if segment]
+    except ValueError:
+        segments = []
+    if not segments:
+        pattern = '/'
+    elif len(segments) == 1:
+        pattern = '/*'
+    else:
+        pattern = f"/{segments[0]}/*"
+    return get_site(url) + pattern + (' room' if room_page else '')
+
+
+def get_page_tier(url, room_page=False):
+    with _tiers_lock:
+        entry = load_tiers().get(tier_key(url, room_page))
+    if not entry or time.time() - entry.get('updated', 0) > TIER_TTL:
+        return None
+    return entry['tier']
+
+
+def record_page_tier(url, tier, room_page=False):
+    key = tier_key(url, room_page)
+    with _tiers_lock:
+        tiers = load_tiers()
+        entry = tiers.get(key)
+        age = time.time() - entry.get('updated', 0) if entry else None
+        if entry and entry['tier'] == tier and age <= TIER_TTL / 2:
+            return
+        # A page pattern that needed the browser for any page keeps that tier
+        if entry and entry['tier'] == 'browser' and tier == 'static' and age <= TIER_TTL:
+            return
+        tiers[key] = {'tier': tier, 'updated': time.time()}
+        try:
+            os.makedirs(os.path.dirname(TIERS_FILE) or '.', exist_ok=True)
+            tmp_path = f"{TIERS_FILE}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(tiers, f, indent=2)
+            os.replace(tmp_path, TIERS_FILE)
+        except Exception as e:
+            logger.error(f"Failed to persist fetch tiers: {e}")
+
+
+def is_usable_html(html, room_page=False):
+    """Heuristics deciding whether server-rendered HTML can skip the browser.
+    Link-discovery pages only need their markup and anchors; room pages must
+    also carry enough text and listing content."""
+    anchors = len(ANCHOR_PATTERN.findall(html))
+    text = TAG_PATTERN.sub(' ', NON_CONTENT_PATTERN.sub(' ', html))
+
+    if anchors < MIN_ANCHORS:
+        return False, f"only {anchors} anchors"
+    for pattern in SPA_SHELL_PATTERNS:
+        if pattern.search(html):
+            return False, "SPA shell marker found"
+    if JAVASCRIPT_REQUIRED_PATTERN.search(text):
+        return False, "page asks for JavaScript"
+    if not room_page:
+        return True, f"{anchors} anchors"
+
+    words = len(text.split())
+    if words < MIN_TEXT_WORDS:
+        return False, f"only {words} words of text"
+    # Listings loaded by JS leave a navigable page with no prices, beds or addresses
+    listing_score = score_chunk(text)
+    if listing_score < MIN_LISTING_SCORE:
+        return False, f"listing signal score {listing_score:.1f}"
+    return True, f"{anchors} anchors, {words} words, listing signal score {listing_score:.1f}"
+
+
+def fetch_static(url):
+    logger.info(f"Initiated static fetch for link: {url}")
+    try:
+        response = get_session().get(url, timeout=STATIC_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning(f"Static fetch failed for {url}: {e}")
+        return None
+
+    content_type = response.headers.get('Content-Type', '')
+    if response.status_code != 200 or 'html' not in content_type:
+        logger.warning(f"Static fetch unusable for {url} (status: {response.status_code}, type: {content_type})")
+        return None
+
+    return {
+        'url': url,
+        'final_url': response.url,
+        'status': response.status_code,
+        'html': response.text,
+        'tier': 'static',
+    }
+
+
+def fetch_page(url, profile=None, room_page=False, refresh=False):
+    """Fetch ``url`` through the page cache, then the cheapest tier that yields usable HTML.
+    ``room_page`` marks pages listings are extracted from, which are held to a stricter check.
+    ``refresh=True`` skips the cached copy (except in cache-only mode) and stores the new one."""
+    page = None if refresh and get_cache_mode() != 'cache-only' else get_cached_page(url)
+    if page:
+        return page
+    if get_cache_mode() == 'cache-only':
+        logger.warning(f"Page not in cache and cache-only mode is set: {url}")
+        return None
+
+    page = fetch_uncached(url, profile, room_page)
+    store_page(page)
+    return page
+
+
+def fetch_uncached(url, profile=None, room_page=False):
+    tier = FETCH_TIER if FETCH_TIER in ('static', 'browser') else get_page_tier(url, room_page)
+
+    if tier != 'browser':
+        page = fetch_static(url)
+        if page:
+            usable, reason = is_usable_html(page['html'], room_page)
+            if usable or FETCH_TIER == 'static':
+                logger.info(f"Using static HTML for {url} ({reason})")
+                if FETCH_TIER == 'auto':
+                    record_page_tier(url, 'static', room_page)
+                return page
+            logger.info(f"Escalating {url} to browser rendering: {reason}")
+        if FETCH_TIER == 'static':
+            return None
+
+    try:
+        # Importing the browser stack is deferred until a page needs it
+        from scrapper import render_page
+        page = render_page(url, profile)
+    except Exception as e:
+        logger.error(f"Error in rendering page: {e}")
+        return None
+
+    if FETCH_TIER == 'auto':
+        record_page_tier(url, 'browser', room_page)
+    return page
+
+
+def fetch_parsed_page(url, profile=None, room_page=False, refresh=False):
+    page = fetch_page(url, profile, room_page, refresh)
+    if not page:
+        return None
+
+    logger.info(f"Successfully scraped the data for link: {url} (tier: {page['tier']})")
+    meta = {key: value for key, value in page.items() if key != 'html'}
+    return ParsedPage(page['html'], url=page.get('final_url') or url, meta=meta)
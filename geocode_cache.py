@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+# Shares the result database's geocodes table when RESULT includes sqlite
+_use_result_db = 'sqlite' in os.getenv('RESULT', 'local').lower()
+_default_path = (os.getenv('RESULT_DB_PATH', os.path.join('results', 'results.sqlite')) if _use_result_db
+                 else os.path.join('cache', 'geocode_cache.sqlite'))
+CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH') or _default_path
+CACHE_ENABLED = os.getenv('GEOCODE_CACHE', 'true').lower() == 'true'
+# Found addresses rarely move; misses are retried sooner in case the provider learns them
+CACHE_TTL = float(os.getenv('GEOCODE_CACHE_TTL_DAYS', 90)) * 86400
+NEGATIVE_TTL = float(os.getenv('GEOCODE_NEGATIVE_TTL_DAYS', 7)) * 86400
+
+ABBREVIATIONS = {
+    'st': 'street', 'str': 'street', 'ave': 'avenue', 'av': 'avenue', 'rd': 'road', 'blvd': 'boulevard',
+    'dr': 'drive', 'ln': 'lane', 'ct': 'court', 'pl': 'place', 'sq': 'square', 'ter': 'terrace',
+    'pkwy': 'parkway', 'hwy': 'highway', 'cir': 'circle', 'trl': 'trail', 'mt': 'mount',
+    'n': 'north', 's': 'south', 'e': 'east', 'w': 'west',
+    'ne': 'northeast', 'nw': 'northwest', 'se': 'southeast', 'sw': 'southwest',
+}
+# A unit designator and its number: "apt 4b", "unit 12", "suite 300", "#5", "room 2"
+UNIT_PATTERN = re.compile(r'(?:\b(?:apt|apartment|unit|suite|ste|room|rm|flat|floor)\b\.?|#)\s*[\w-]+')
+# The same designators in a provider's Full_Address, only where the unit is a number or a single
+# letter, so street names such as "Flat Rock Rd" or "Suite Street" are kept
+FULL_ADDRESS_UNIT_PATTERN = re.compile(
+    r'(?:\b(?:apt|apartment|unit|suite|ste|room|rm|flat|floor)\b\.?|#)\s*(?:[\w-]*\d[\w-]*|[a-z]\b)', re.IGNORECASE
+)
+# Fields that describe the building and so hold for every unit folded into one cache key
+BUILDING_FIELDS = ('Street_Number', 'Street_Name', 'Zipcode', 'State', 'City', 'County', 'Latitude', 'Longitude')
+
+_local = threading.local()
+_stats = {'lookups': 0, 'hits': 0, 'negative_hits': 0, 'stores': 0, 'deduped': 0}
+_stats_lock = threading.Lock()
+
+
+def normalize_address(address):
+    """Cache key for an address: case, punctuation, whitespace, unit numbers and
+    street abbreviations are folded, so "12 Main St., Apt 4" == "12 main street"."""
+    text = (address or '').lower()
+    text = UNIT_PATTERN.sub(' ', text)
+    segments = []
+    for segment in text.split(','):
+        words = re.findall(r"[a-z0-9]+(?:'[a-z]+)?", segment)
+        expanded = []
+        for position, word in enumerate(words):
+            if word == 'st' and (position == 0 or words[position - 1].isdigit()) and position + 1 < len(words):
+                # "St Louis", "12 St Marks Pl": saint, not street
+                expanded.append('saint')
+            else:
+                expanded.append(ABBREVIATIONS.get(word, word))
+        if expanded:
+            segments.append(' '.join(expanded))
+    return ', '.join(segments)
+
+
+def address_unit(address):
+    """Unit designators in ``address`` ("apt 4", "#5"), compared ignoring punctuation."""
+    return sorted(re.sub(r'[^a-z0-9#]', '', unit) for unit in UNIT_PATTERN.findall((address or '').lower()))
+
+
+def building_details(details):
+    """``details`` without anything specific to one unit: building fields are kept and
+    the unit is removed from Full_Address, so they can be shared by other units."""
+    if not details:
+        return details
+    shared = {field: value for field, value in details.items() if field in BUILDING_FIELDS}
+    if details.get('Full_Address'):
+        parts = [' '.join(part.split()) for part in FULL_ADDRESS_UNIT_PATTERN.sub(' ', details['Full_Address']).split(',')]
+        shared['Full_Address'] = ', '.join(part for part in parts if part)
+    return shared
+
+
+def details_for(address, source_address, details):
+    """Details geocoded for ``source_address`` as they apply to ``address``, an address
+    folded into the same key: whole when the units match, else building fields only."""
+    if address == source_address or address_unit(address) == address_unit(source_address):
+        return details
+    return building_details(details)
+
+
+def get_connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        os.makedirs(os.path.dirname(CACHE_PATH) or '.', exist_ok=True)
+        connection = sqlite3.connect(CACHE_PATH, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS geocodes (provider TEXT NOT NULL, address TEXT NOT NULL, '
+            'result TEXT, created_at REAL, PRIMARY KEY (provider, address))'
+        )
+        _local.connection = connection
+    return connection
+
+
+def count_stat(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def get_cached_geocode(provider, address, record_lookup=True):
+    """Return (details, found). ``details`` is None for a remembered miss.
+    ``record_lookup=False`` keeps further lookups of the same address (for
+    other providers) out of the hit rate."""
+    if not CACHE_ENABLED:
+        return None, False
+    if record_lookup:
+        count_stat('lookups')
+    try:
+        row = get_connection().execute(
+            'SELECT result, created_at FROM geocodes WHERE provider = ? AND address = ?',
+            (provider, normalize_address(address))
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Geocode cache lookup failed: {e}")
+        return None, False
+    if not row:
+        return None, False
+    details = json.loads(row[0])
+    if time.time() - row[1] > (CACHE_TTL if details else NEGATIVE_TTL):
+        return None, False
+    count_stat('hits' if details else 'negative_hits')
+    logger.debug(f"Geocode cache hit for {address}")
+    # Entries written before units were stripped may still name one unit
+    return building_details(details), True
+
+
+def store_geocode(provider, address, details):
+    """Remember a provider's answer for ``address``; ``details=None`` records that it was not found.
+    The key folds units, so only the building-level details are stored."""
+    if not CACHE_ENABLED:
+        return
+    try:
+        get_connection().execute(
+            'INSERT OR REPLACE INTO geocodes (provider, address, result, created_at) VALUES (?, ?, ?, ?)',
+            (provider, normalize_address(address), json.dumps(building_details(details)), time.time())
+        )
+        count_stat('stores')
+    except sqlite3.Error as e:
+        logger.warning(f"Geocode cache store failed: {e}")
+
+
+def dedupe_addresses(addresses):
+    """Group addresses by normalised form; returns {normalised: [original addresses]}."""
+    groups = {}
+    for address in addresses:
+        if address:
+            groups.setdefault(normalize_address(address), []).append(address)
+    count_stat('deduped', sum(len(group) - 1 for group in groups.values()))
+    return groups
+
+
+def get_geocode_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def log_geocode_cache_report():
+    stats = get_geocode_cache_stats()
+    if not stats['lookups'] and not stats['deduped']:
+        return
+    hits = stats['hits'] + stats['negative_hits']
+    rate = hits / stats['lookups'] * 100 if stats['lookups'] else 0
+    logger.info(
+        f"Geocode cache: {hits}/{stats['lookups']} hits ({rate:.0f}%, {stats['negative_hits']} remembered misses), "
+        f"{stats['deduped']} duplicate addresses skipped, {stats['stores']} results stored"
+    )
@@ -1,11 +1,59 @@
 import geocoder
+import requests
+from requests.adapters import HTTPAdapter
 from logger_config import logger
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from geocode_cache import get_cached_geocode, store_geocode, dedupe_addresses, details_for
+from rate_limiter import acquire, backoff_delay, report_rate_limited
+
+load_dotenv()
+
+# Addresses geocoded in parallel; each provider's rate limit (OPENCAGE_RPM, GOOGLE_RPM) still applies
+GEOCODE_WORKERS = int(os.getenv('GEOCODE_WORKERS', 8))
+# Retries of a rate limited (429) request before moving on to the next provider
+GEOCODE_MAX_RETRIES = int(os.getenv('GEOCODE_MAX_RETRIES', 3))
+# Consecutive failed calls after which a provider is skipped for GEOCODE_FAILOVER_COOLDOWN seconds
+GEOCODE_FAILOVER_AFTER = int(os.getenv('GEOCODE_FAILOVER_AFTER', 3))
+GEOCODE_FAILOVER_COOLDOWN = float(os.getenv('GEOCODE_FAILOVER_COOLDOWN', 60))
+
+_sessions = threading.local()
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+class GeocodingError(Exception):
+    """The provider call failed (network, quota, bad key), as opposed to finding nothing."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def check_not_found(g, provider):
+    # A clean reply without a match is a real miss and can be cached; anything else is an error
+    if g.status_code not in (None, 200) or (g.error and 'no results' not in str(g.error).lower()
+                                           and 'zero_results' not in str(g.error).lower()):
+        raise GeocodingError(f"{provider} request failed: {g.status_code} {g.error}", g.status_code)
+
+def get_session():
+    """Keep-alive HTTP session for this worker thread, passed to geocoder via session=."""
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _sessions.session = session
+    return session
 
 def geocode_with_opencage(address, api_key):
     try:
         logger.info(f"Attempting to geocode address with OpenCage: {address}")
-        g = geocoder.opencage(address, key=api_key)
+        g = geocoder.opencage(address, key=api_key, session=get_session())
         
         if g.ok:
             logger.debug(f"Successfully geocoded address with OpenCage: {g}")
@@ -22,16 +70,19 @@ def geocode_with_opencage(address, api_key):
                 "County": components.get('county', '')
             }
         else:
+            check_not_found(g, 'OpenCage')
             logger.warning(f"OpenCage could not find coordinates for address: {address}. Error: {g.error}")
             return None
+    except GeocodingError:
+        raise
     except Exception as e:
         logger.error(f"Error occurred while geocoding with OpenCage: {str(e)}")
-        return None
+        raise GeocodingError(str(e))
 
 def geocode_with_google(address, api_key):
     try:
         logger.info(f"Attempting to geocode address with Google: {address}")
-        g = geocoder.google(address, key=api_key)
+        g = geocoder.google(address, key=api_key, session=get_session())
         
         if g.ok:
             logger.debug(f"Successfully geocoded address with Google: {g}")
@@ -48,31 +99,125 @@ def geocode_with_google(address, api_key):
                 "County": next((item['long_name'] for item in components if 'administrative_area_level_2' in item['types']), '')
             }
         else:
+            check_not_found(g, 'Google')
             logger.warning(f"Google could not find coordinates for address: {address}. Error: {g.error}")
             return None
+    except GeocodingError:
+        raise
     except Exception as e:
         logger.error(f"Error occurred while geocoding with Google: {str(e)}")
-        return None
+        raise GeocodingError(str(e))
 
-def get_address_details(address):
+PROVIDERS = {
+    'opencage': (geocode_with_opencage, 'OPENCAGE_API_KEY'),
+    'google': (geocode_with_google, 'GOOGLE_API_KEY'),
+}
+
+def get_provider_state(provider):
+    with _providers_lock:
+        return _providers.setdefault(provider, {
+            'calls': 0, 'failures': 0, 'rate_limited': 0, 'failovers': 0,
+            'consecutive_failures': 0, 'skip_until': 0.0,
+        })
+
+def count_provider_stat(provider, name):
+    state = get_provider_state(provider)
+    with _providers_lock:
+        state[name] += 1
+
+def provider_available(provider):
+    state = get_provider_state(provider)
+    with _providers_lock:
+        return state['consecutive_failures'] < GEOCODE_FAILOVER_AFTER or time.monotonic() >= state['skip_until']
+
+def record_provider_result(provider, ok):
+    state = get_provider_state(provider)
+    with _providers_lock:
+        state['calls'] += 1
+        if ok:
+            state['consecutive_failures'] = 0
+            return
+        state['failures'] += 1
+        state['consecutive_failures'] += 1
+        if state['consecutive_failures'] >= GEOCODE_FAILOVER_AFTER:
+            state['skip_until'] = time.monotonic() + GEOCODE_FAILOVER_COOLDOWN
+
+def get_providers():
+    """Providers to try in order: GEOCODING_SERVICE may list several, e.g. "opencage,google"."""
+    services = [name.strip() for name in os.environ.get('GEOCODING_SERVICE', 'opencage').lower().split(',') if name.strip()]
+    if not services or any(name not in PROVIDERS for name in services):
+        logger.error("Invalid geocoding service specified. Use 'opencage', 'google' or 'opencage,google'.")
+        return []
     # Get API keys from environment variables
-    opencage_api_key = os.environ.get('OPENCAGE_API_KEY')
-    google_api_key = os.environ.get('GOOGLE_API_KEY')
-    geocoding_service = os.environ.get('GEOCODING_SERVICE', 'opencage').lower()
+    return [name for name in services if os.environ.get(PROVIDERS[name][1])]
 
-    if geocoding_service not in ['opencage', 'google']:
-        logger.error("Invalid geocoding service specified. Use 'opencage' or 'google'.")
-        return None
+def call_provider(provider, address):
+    """Geocode with one provider, waiting for its quota and retrying 429s; raises GeocodingError."""
+    geocode, key_name = PROVIDERS[provider]
+    for attempt in range(GEOCODE_MAX_RETRIES + 1):
+        acquire(provider, None, 0)
+        try:
+            result = geocode(address, os.environ.get(key_name))
+        except GeocodingError as e:
+            if e.status_code == 429 and attempt < GEOCODE_MAX_RETRIES:
+                count_provider_stat(provider, 'rate_limited')
+                report_rate_limited(provider, None, backoff_delay(attempt))
+                continue
+            record_provider_result(provider, False)
+            raise
+        record_provider_result(provider, True)
+        return result
 
-    if geocoding_service == 'opencage' and opencage_api_key:
-        result = geocode_with_opencage(address, opencage_api_key)
-        if result:
-            return result
+def get_address_details(address):
+    providers = get_providers()
+    for position, provider in enumerate(providers):
+        details, found = get_cached_geocode(provider, address, record_lookup=position == 0)
+        if found:
+            return details
 
-    if geocoding_service == 'google' and google_api_key:
-        result = geocode_with_google(address, google_api_key)
+    for position, provider in enumerate(providers):
+        if not provider_available(provider) and position + 1 < len(providers):
+            continue
+        try:
+            result = call_provider(provider, address)
+        except GeocodingError as e:
+            if position + 1 < len(providers):
+                count_provider_stat(provider, 'failovers')
+                logger.warning(f"Geocoding with {provider} failed ({e}), trying {providers[position + 1]}")
+            continue
+        # Misses are cached too (with a shorter TTL); failed calls are not
+        store_geocode(provider, address, result)
         if result:
             return result
+        break
 
     logger.error("Failed to retrieve address details using the specified service")
     return None
+
+def iter_geocoded(addresses):
+    """Yield (address, details) for each distinct address, in the order the addresses
+    first appear, while up to GEOCODE_WORKERS lookups run concurrently. Addresses that
+    normalise to the same key are geocoded once; other units of the geocoded address
+    only get its building-level details."""
+    groups = list(dedupe_addresses(addresses).values())
+    executor = ThreadPoolExecutor(max_workers=GEOCODE_WORKERS, thread_name_prefix='geocode')
+    try:
+        for group, details in zip(groups, executor.map(lambda group: get_address_details(group[0]), groups)):
+            for address in group:
+                yield address, details_for(address, group[0], details)
+    finally:
+        # On an error or interrupt, drop the queued lookups instead of finishing them
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def geocode_addresses(addresses):
+    """Details for each distinct address in ``addresses`` as {address: details or None}."""
+    return dict(iter_geocoded(addresses))
+
+def log_geocoding_report():
+    with _providers_lock:
+        states = {provider: dict(state) for provider, state in _providers.items()}
+    for provider, state in states.items():
+        logger.info(
+            f"Geocoding provider {provider}: {state['calls']} calls, {state['failures']} failed, "
+            f"{state['rate_limited']} rate limited, {state['failovers']} handed to the next provider"
+        )
@@ -0,0 +1,167 @@
+import os
+import re
+import threading
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from logger_config import logger
+from url_utils import same_page
+
+load_dotenv()
+
+RANKER_THRESHOLD = float(os.getenv('LINK_RANKER_THRESHOLD', 0.6))
+RANKER_TOP_K = int(os.getenv('LINK_RANKER_TOP_K', 15))
+# Still ask the LLM when the ranker is confident, to measure agreement; the LLM's
+# pick is the one used, falling back to the ranker's when the LLM gives none
+RANKER_SHADOW = os.getenv('LINK_RANKER_SHADOW', 'false').lower() == 'true'
+
+# Score above which a candidate counts as a strong room-page match
+STRONG_SCORE = 5.0
+
+ANCHOR_KEYWORDS = {
+    'room', 'rooms', 'suite', 'suites', 'accommodation', 'accommodations', 'stay', 'rental', 'rentals',
+    'apartment', 'apartments', 'availability', 'available', 'floorplans', 'floor', 'plans', 'units',
+    'listings', 'lodging', 'homes', 'properties', 'vacancy', 'residences', 'book', 'booking', 'reserve',
+}
+
+NEGATIVE_TOKENS = {
+    'blog', 'news', 'contact', 'about', 'privacy', 'policy', 'terms', 'careers', 'jobs', 'faq', 'login',
+    'signin', 'register', 'cart', 'gallery', 'photos', 'events', 'press', 'sitemap', 'cookie', 'cookies',
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+_stats = {
+    'sites': 0,
+    'resolved_locally': 0,
+    'llm_calls': 0,
+    'llm_agreed': 0,
+    'shadow_checks': 0,
+    'shadow_agreed': 0,
+    'unresolved': 0,
+}
+_stats_lock = threading.Lock()
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def get_endpoint_tokens(endpoints):
+    return [(endpoint.strip('/').lower(), set(tokenize(endpoint))) for endpoint in endpoints]
+
+
+def score_link(url, anchor, endpoint_tokens, total_anchors):
+    """Score one candidate URL by path, anchor text, depth and nav position."""
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.lower().split('/') if segment]
+    if not segments:
+        return -3.0
+
+    score = 0.0
+    last_segment = segments[-1]
+    path_tokens = set(tokenize(parsed.path))
+
+    # Path-token matches against COMMON_ENDPOINTS
+    best_overlap = 0.0
+    for endpoint, tokens in endpoint_tokens:
+        if last_segment == endpoint or '/'.join(segments) == endpoint:
+            best_overlap = 1.5
+            break
+        if tokens:
+            best_overlap = max(best_overlap, len(tokens & path_tokens) / len(tokens))
+    score += 2.0 * best_overlap
+
+    anchor_tokens = set(tokenize(anchor.get('text', ''))) if anchor else set()
+    score += min(2.0, 1.0 * len(anchor_tokens & ANCHOR_KEYWORDS))
+
+    if (path_tokens | anchor_tokens) & NEGATIVE_TOKENS:
+        score -= 2.0
+
+    score -= 0.5 * (len(segments) - 1)
+    if parsed.query:
+        score -= 0.5
+
+    if anchor and anchor.get('in_nav'):
+        score += 0.5
+        if total_anchors:
+            score += 0.5 * (1 - anchor.get('position', total_anchors) / total_anchors)
+
+    return score
+
+
+def rank_links(urls, endpoints):
+    """Return [(url, score), ...] best first and a 0-1 confidence for the top pick.
+
+    ``urls`` is either a plain iterable of URLs or a dict mapping each URL to
+    its anchor details (text, in_nav, position) from get_unique_urls.
+    """
+    anchors = urls if isinstance(urls, dict) else {url: None for url in urls}
+    if not anchors:
+        return [], 0.0
+
+    endpoint_tokens = get_endpoint_tokens(endpoints)
+    total_anchors = max((a.get('position', 0) for a in anchors.values() if a), default=0) + 1
+    ranked = sorted(
+        ((url, score_link(url, anchor, endpoint_tokens, total_anchors)) for url, anchor in anchors.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+
+    top = ranked[0][1]
+    if top <= 0:
+        return ranked, 0.0
+    second = max(ranked[1][1], 0.0) if len(ranked) > 1 else 0.0
+    confidence = min(1.0, top / STRONG_SCORE) * (1 - second / top)
+    return ranked, confidence
+
+
+def record_local(ranked, confidence):
+    with _stats_lock:
+        _stats['sites'] += 1
+        _stats['resolved_locally'] += 1
+    logger.info(f"Link ranker resolved {ranked[0][0]} without LLM (confidence: {confidence:.2f})")
+
+
+def record_llm(llm_url, ranked, shadow=False):
+    agreed = bool(ranked) and same_page(llm_url, ranked[0][0])
+    with _stats_lock:
+        _stats['sites'] += 1
+        if shadow:
+            _stats['shadow_checks'] += 1
+            _stats['shadow_agreed'] += agreed
+        else:
+            _stats['llm_calls'] += 1
+            _stats['llm_agreed'] += agreed
+    if ranked:
+        logger.info(f"Link ranker top pick {ranked[0][0]} {'agrees' if agreed else 'disagrees'} with LLM pick {llm_url}")
+
+
+def record_unresolved():
+    with _stats_lock:
+        _stats['sites'] += 1
+        _stats['unresolved'] += 1
+
+
+def get_ranker_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def log_ranker_report():
+    stats = get_ranker_stats()
+    if not stats['sites']:
+        return
+    skipped = stats['resolved_locally'] / stats['sites'] * 100
+    logger.info(
+        f"Link ranker: LLM skipped for {stats['resolved_locally']}/{stats['sites']} sites ({skipped:.0f}%), "
+        f"{stats['unresolved']} sites without a room link"
+    )
+    if stats['llm_calls']:
+        agreed = stats['llm_agreed'] / stats['llm_calls'] * 100
+        logger.info(f"Link ranker agreed with LLM on {stats['llm_agreed']}/{stats['llm_calls']} LLM-resolved sites ({agreed:.0f}%)")
+    if stats['shadow_checks']:
+        agreed = stats['shadow_agreed'] / stats['shadow_checks'] * 100
+        logger.info(
+            "Link ranker confident picks confirmed by LLM (shadow mode, LLM pick used): "
+            f"{stats['shadow_agreed']}/{stats['shadow_checks']} ({agreed:.0f}%)"
+        )
@@ -1,13 +1,12 @@
-import os
-from groq import Groq
 from dotenv import load_dotenv
-from SimplerLLM.tools.json_helpers import extract_json_from_text
 from logger_config import logger
 from connect_ai import connect_to_ai
+from schemas import ROOM_LINK_SCHEMA, has_success_status
+from llm_metrics import call_context
+from link_ranker import rank_links, record_local, record_llm, record_unresolved, RANKER_THRESHOLD, RANKER_TOP_K, RANKER_SHADOW
 
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 # Define a list of common endpoints
 COMMON_ENDPOINTS = [
     "/all-rooms",
@@ -83,13 +82,11 @@ Do not include any additional text, comments, or explanations outside of the JSO
 """
 
 
-def extract_link(response):
+def extract_link(data):
     logger.info("Initiated extracting data")
     try:
-        json_data = extract_json_from_text(response)
-        if json_data:
+        if data:
             logger.info("Successfully extracted the data")
-            data = json_data[0]
             status = data.get('status')
             message = data.get('message')
             url = data.get('url')
@@ -114,19 +111,36 @@ def extract_link(response):
         logger.error(f"Error in extract_link: {e}")
         return None
 
-def retrieve_room_link(urls):
+def retrieve_room_link(urls, refresh=False):
     logger.info("Initiated Link retriever agent")
-    response = connect_to_ai(prompt, f"Find the Room page url. From here:{urls}")
+    ranked, confidence = rank_links(urls, COMMON_ENDPOINTS)
+    confident = bool(ranked) and confidence >= RANKER_THRESHOLD
+    if confident and not RANKER_SHADOW:
+        record_local(ranked, confidence)
+        return ranked[0][0]
+
+    candidates = [url for url, _ in ranked[:RANKER_TOP_K]]
+    logger.info(f"Sending top {len(candidates)} of {len(urls)} urls to AI (ranker confidence: {confidence:.2f})")
+    with call_context(stage="link"):
+        response = connect_to_ai(
+            prompt, f"Find the Room page url. From here:{candidates}",
+            refresh=refresh, cache_if=has_success_status, schema=ROOM_LINK_SCHEMA,
+        )
     if response:
         url = extract_link(response)
-        logger.info(f"Processed all {len(urls)} urls")
+        logger.info(f"Processed all {len(candidates)} urls")
         if url:
+            record_llm(url, ranked, shadow=confident)
             logger.info(f"Total results retrieved: 1")
             logger.info(f"Retrieved URL: {url}")
             return url
         else:
             logger.warning("No valid URL extracted from AI response")
-            return None
     else:
         logger.warning("No response from AI")
-        return None
+
+    if confident:
+        record_local(ranked, confidence)
+        return ranked[0][0]
+    record_unresolved()
+    return None
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join('cache', 'llm_cache.sqlite'))
+CACHE_ENABLED = os.getenv('LLM_CACHE', 'true').lower() == 'true'
+CACHE_MAX_BYTES = int(float(os.getenv('LLM_CACHE_MAX_MB', 200)) * 1024 * 1024)
+# 0 keeps entries until they are evicted for size
+CACHE_TTL = float(os.getenv('LLM_CACHE_TTL_HOURS', 0)) * 3600
+# Evict at most every N writes; checking the table size on every write is wasteful
+EVICTION_INTERVAL = 50
+
+_local = threading.local()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'saved_tokens': 0}
+_stats_lock = threading.Lock()
+
+
+def get_connection():
+    """One connection per thread; WAL lets threads and processes share the file."""
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        os.makedirs(os.path.dirname(CACHE_PATH) or '.', exist_ok=True)
+        connection = sqlite3.connect(CACHE_PATH, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, provider TEXT, model TEXT, response TEXT, '
+            'size INTEGER, tokens INTEGER, created_at REAL, last_access REAL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        _local.connection = connection
+        _local.writes = 0
+    return connection
+
+
+def cache_key(provider, model, prompt, user_content):
+    payload = json.dumps([provider, model or '', prompt, user_content], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_response(key, record_miss=True):
+    """Cached response for ``key``; ``record_miss=False`` keeps a lookup that
+    is followed by another one for the same call out of the miss count."""
+    if not CACHE_ENABLED:
+        return None
+    try:
+        connection = get_connection()
+        row = connection.execute(
+            'SELECT response, tokens, created_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row and CACHE_TTL and time.time() - row[2] > CACHE_TTL:
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            row = None
+
+        with _stats_lock:
+            if row:
+                _stats['hits'] += 1
+                _stats['saved_tokens'] += row[1]
+            elif record_miss:
+                _stats['misses'] += 1
+        if not row:
+            return None
+
+        connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+        logger.info("LLM cache hit")
+        return row[0]
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache lookup failed: {e}")
+        return None
+
+
+def store_response(key, provider, model, response, tokens):
+    if not CACHE_ENABLED or not response:
+        return
+    try:
+        connection = get_connection()
+        now = time.time()
+        connection.execute(
+            'INSERT OR REPLACE INTO responses (key, provider, model, response, size, tokens, created_at, last_access) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, provider, model or '', response, len(response.encode('utf-8')), tokens, now, now)
+        )
+        with _stats_lock:
+            _stats['stores'] += 1
+        _local.writes += 1
+        if _local.writes % EVICTION_INTERVAL == 1:
+            evict(connection)
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache store failed: {e}")
+
+
+def evict(connection):
+    """Drop expired entries, then least recently used ones until under the size limit."""
+    if CACHE_TTL:
+        connection.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - CACHE_TTL,))
+    total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+    if total <= CACHE_MAX_BYTES:
+        return
+
+    target = CACHE_MAX_BYTES * 0.9
+    evicted = 0
+    for key, size in connection.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall():
+        if total <= target:
+            break
+        connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+        total -= size
+        evicted += 1
+    logger.info(f"Evicted {evicted} entries from LLM cache")
+
+
+def get_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def log_cache_report():
+    stats = get_cache_stats()
+    lookups = stats['hits'] + stats['misses']
+    if not lookups:
+        return
+    logger.info(
+        f"LLM cache: {stats['hits']}/{lookups} hits ({stats['hits'] / lookups * 100:.0f}%), "
+        f"{stats['misses']} misses, ~{stats['saved_tokens']} tokens saved"
+    )
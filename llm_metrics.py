@@ -0,0 +1,191 @@
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+METRICS_DIR = os.getenv('LLM_METRICS_DIR', 'logs')
+# JSON file of {"model name or prefix": {"input": USD per 1M tokens, "output": USD per 1M tokens}}
+# merged over the defaults below
+PRICE_TABLE_FILE = os.getenv('LLM_PRICE_TABLE', os.path.join('data', 'llm_prices.json'))
+
+DEFAULT_PRICES = {
+    'llama-3.1-8b-instant': {'input': 0.05, 'output': 0.08},
+    'llama-3.3-70b-versatile': {'input': 0.59, 'output': 0.79},
+    'llama-3.1-70b': {'input': 0.59, 'output': 0.79},
+    'llama-3.2-90b': {'input': 0.90, 'output': 0.90},
+    'gemini-1.5-flash-8b': {'input': 0.0375, 'output': 0.15},
+    'gemini-1.5-flash': {'input': 0.075, 'output': 0.30},
+    'gemini-1.5-pro': {'input': 1.25, 'output': 5.00},
+    'gemini-2.0-flash': {'input': 0.10, 'output': 0.40},
+}
+
+# Site and pipeline stage ('link' or 'data') of the calls made in this context;
+# 'shares' splits one batched call across the segments it carried
+_context = contextvars.ContextVar('llm_call_context', default={})
+_usage = threading.local()
+
+_totals = {}
+_totals_lock = threading.Lock()
+_prices = None
+
+
+def get_call_context():
+    return _context.get()
+
+
+@contextmanager
+def call_context(**values):
+    """Attribute the LLM calls made inside the block to a site, stage or batch."""
+    token = _context.set({**_context.get(), **{key: value for key, value in values.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def run_with_context(func, *args, site=None, stage=None, **kwargs):
+    with call_context(site=site, stage=stage):
+        return func(*args, **kwargs)
+
+
+def note_usage(prompt_tokens, completion_tokens):
+    """Called by provider connectors with the token counts the API reported."""
+    _usage.value = (prompt_tokens, completion_tokens)
+
+
+def take_usage():
+    value = getattr(_usage, 'value', None)
+    _usage.value = None
+    return value
+
+
+def load_prices():
+    global _prices
+    if _prices is None:
+        prices = dict(DEFAULT_PRICES)
+        if os.path.exists(PRICE_TABLE_FILE):
+            try:
+                with open(PRICE_TABLE_FILE, 'r') as f:
+                    prices.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read price table {PRICE_TABLE_FILE}: {e}")
+        _prices = prices
+    return _prices
+
+
+def get_price(model):
+    """Price entry for ``model``, falling back to the longest matching prefix."""
+    prices = load_prices()
+    if not model:
+        return None
+    if model in prices:
+        return prices[model]
+    matches = [name for name in prices if model.startswith(name)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def new_totals():
+    return {
+        'calls': 0, 'failures': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+        'estimated_tokens': 0, 'latency': 0.0, 'queue_wait': 0.0, 'cost': 0.0, 'unpriced_calls': 0,
+    }
+
+
+def add_to_totals(keys, values):
+    with _totals_lock:
+        for key in keys:
+            totals = _totals.setdefault(key, new_totals())
+            for name, value in values.items():
+                totals[name] += value
+
+
+def record_call(provider, model, prompt_tokens, completion_tokens, latency, queue_wait, ok=True, estimated=False):
+    """Record one provider call, split across the batch shares in the current context if any."""
+    context = get_call_context()
+    price = get_price(model)
+    cost = 0.0
+    if price:
+        cost = (prompt_tokens * price['input'] + completion_tokens * price['output']) / 1_000_000
+
+    shares = context.get('shares') or [(context.get('site'), context.get('stage'), 1)]
+    total_weight = sum(weight for _, _, weight in shares) or 1
+    for site, stage, weight in shares:
+        fraction = weight / total_weight
+        values = {
+            'calls': fraction,
+            'failures': 0 if ok else fraction,
+            'prompt_tokens': prompt_tokens * fraction,
+            'completion_tokens': completion_tokens * fraction,
+            'estimated_tokens': (prompt_tokens + completion_tokens) * fraction if estimated else 0,
+            'latency': latency * fraction,
+            'queue_wait': queue_wait * fraction,
+            'cost': cost * fraction,
+            'unpriced_calls': 0 if price else fraction,
+        }
+        add_to_totals(
+            [('run', 'all'), ('site', site or 'unknown'), ('stage', stage or 'unknown'), ('model', f"{provider}/{model}")],
+            values,
+        )
+    logger.debug(
+        f"LLM call {provider}/{model}: {prompt_tokens}+{completion_tokens} tokens, {latency:.2f}s, "
+        f"waited {queue_wait:.2f}s, ${cost:.5f} ({context.get('stage', 'unknown')} stage, {context.get('site', 'unknown')})"
+    )
+
+
+def record_cache_hit(provider, model):
+    context = get_call_context()
+    add_to_totals(
+        [('run', 'all'), ('site', context.get('site') or 'unknown'), ('stage', context.get('stage') or 'unknown'),
+         ('model', f"{provider}/{model}")],
+        {'cache_hits': 1},
+    )
+
+
+def get_metrics():
+    with _totals_lock:
+        snapshot = {key: dict(values) for key, values in _totals.items()}
+
+    report = {'run': new_totals(), 'stages': {}, 'models': {}, 'sites': {}}
+    groups = {'stage': 'stages', 'model': 'models', 'site': 'sites'}
+    for (kind, name), values in snapshot.items():
+        values = {key: round(value, 6) if isinstance(value, float) else value for key, value in values.items()}
+        calls = values['calls']
+        values['avg_latency'] = round(values['latency'] / calls, 3) if calls else 0.0
+        values['avg_queue_wait'] = round(values['queue_wait'] / calls, 3) if calls else 0.0
+        if kind == 'run':
+            report['run'] = values
+        else:
+            report[groups[kind]][name] = values
+    return report
+
+
+def write_metrics_report():
+    """Write the run's LLM metrics as JSON and log the totals; returns the file path."""
+    report = get_metrics()
+    run = report['run']
+    if not run['calls'] and not run['cache_hits']:
+        return None
+
+    report['generated_at'] = datetime.now().isoformat(timespec='seconds')
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"llm_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    logger.info(
+        f"LLM usage: {run['calls']:.0f} calls ({run['cache_hits']} cache hits), "
+        f"{run['prompt_tokens']:.0f} prompt + {run['completion_tokens']:.0f} completion tokens, "
+        f"avg latency {run['avg_latency']:.2f}s, estimated cost ${run['cost']:.4f}; report written to {path}"
+    )
+    for stage, values in report['stages'].items():
+        logger.info(
+            f"LLM usage for {stage} stage: {values['calls']:.0f} calls, "
+            f"{values['prompt_tokens'] + values['completion_tokens']:.0f} tokens, ${values['cost']:.4f}"
+        )
+    return path
@@ -1,31 +1,52 @@
 import os
 import json
 import csv
+import argparse
 from dotenv import load_dotenv
 from link_retriever_agent import retrieve_room_link
 from data_retriever_agent import retrieve_room_data
-from scrapper import scrape_data
+from fetcher import fetch_parsed_page
+from driver_pool import shutdown_driver_pool
+from link_ranker import log_ranker_report
+from rate_limiter import log_limiter_report
+from llm_cache import log_cache_report
+from chunk_filter import log_filter_report
+from provider_health import log_provider_report
+from request_batcher import log_batch_report
+from llm_metrics import run_with_context, write_metrics_report
+from page_cache import set_cache_mode
 from logger_config import logger
-from save_data import save
+from url_utils import normalize_url, canonical_key, get_site, is_same_site, should_skip_url
+from save_data import save, finalize_results
 from process_data import process
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 load_dotenv()
 
-def get_unique_urls(soup, base_url):
+def get_unique_urls(page, base_url):
     logger.info("Initiating URL collection")
-    base_url = base_url.rstrip('/')
-    unique_urls = set()
+    # url -> details of the first anchor pointing at it, used by the link ranker
+    unique_urls = {}
+    seen_keys = {}
+    page_url = page.url or base_url
     
     try:
-        for link in soup.find_all('a', href=True):
-            href = link['href'].lstrip('/')
+        for anchor in page.anchors:
+            href = normalize_url(anchor['href'], page_url)
+            if not href or not is_same_site(href, base_url) or should_skip_url(href):
+                continue
             
-            if not href.startswith(('http://', 'https://')):
-                href = f"{base_url}/{href}"
+            key = canonical_key(href)
+            if key not in seen_keys:
+                seen_keys[key] = href
+                unique_urls[href] = {**anchor, 'href': href}
+                continue
             
-            if href.startswith(base_url):
-                unique_urls.add(href)
+            existing = unique_urls[seen_keys[key]]
+            if anchor['in_nav']:
+                existing['in_nav'] = True
+            if not existing['text']:
+                existing['text'] = anchor['text']
         
         logger.info(f"Collected URLs successfully. Unique URLs found: {len(unique_urls)}")
         
@@ -35,23 +56,20 @@ def get_unique_urls(soup, base_url):
         return unique_urls
     except Exception as e:
         logger.error(f"Failed to collect URLs: {e}")
-        return set()
+        return {}
 
-def get_room_details(text):
+def get_room_details(text, html=None, refresh=False, site=None):
     logger.info("Initiated collecting room details")
     try:
-        response = retrieve_room_data(text)
+        response = retrieve_room_data(text, html, refresh=refresh, site=site)
         return response
     except Exception as e:
         logger.error(f"Error in retrieving room details: {e}")
         return None
 
-def process_room_soup(soup):
-    logger.info("Processing room soup")
-    for tag in soup(["head", "script", "style", "input", "textarea", "iframe", "noscript", "svg", "img", "br"]):
-        tag.decompose()
-        
-    text = soup.get_text(separator=' ', strip=True)
+def process_room_page(page):
+    logger.info("Processing room page")
+    text = page.text
     logger.debug("Retrieved page data: ")
     logger.debug(text)
     return text
@@ -62,14 +80,14 @@ def main(base_url):
     data_to_save = {'URL_Scrapped': base_url}
     note = "Process initiated"
     
-    soup = scrape_data(base_url)
-    if not soup:
+    page = fetch_parsed_page(base_url)
+    if not page:
         note = "Initial page scraping failed"
         logger.error(note)
         save([{**data_to_save, 'Note': note}], 'error')
         return
     
-    unique_urls = get_unique_urls(soup, base_url)
+    unique_urls = get_unique_urls(page, base_url)
     if not unique_urls:
         note = "No unique URLs found"
         logger.error(note)
@@ -86,15 +104,15 @@ def main(base_url):
     data_to_save['URL_Scrapped'] = link
     note = "Room link retrieved successfully"
     
-    room_page_soup = scrape_data(link)
-    if not room_page_soup:
+    room_page = fetch_parsed_page(link, room_page=True)
+    if not room_page:
         note = "Room page scraping failed"
         logger.error(note)
         save([{**data_to_save, 'Note': note}], 'error')
         return
     
-    room_page_text = process_room_soup(room_page_soup)
-    room_details = get_room_details(room_page_text)
+    room_page_text = process_room_page(room_page)
+    room_details = get_room_details(room_page_text, room_page.html, site=get_site(room_page.url))
     if not room_details:
         note = "Room details retrieval failed"
         logger.error(note)
@@ -127,6 +145,8 @@ def main(base_url):
     
     note = "Data processed successfully"
     
+    # save() fails here only if the rows cannot be queued; rows that are queued but
+    # cannot be written get the same error note from finalize_results()
     if save([{**item, 'Note': note} for item in processed_data], 'success'):
         logger.info("Successfully saved processed data")
         return True
@@ -145,18 +165,45 @@ def process_websites(csv_path, max_workers=int(os.getenv('MAX_WORKERS', 5))):
     
     logger.info(f"Found {len(websites)} websites to process")
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_url = {executor.submit(main, url): url for url in websites}
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                future.result()
-                logger.info(f"Completed processing for {url}")
-            except Exception as exc:
-                logger.error(f"Processing for {url} generated an exception: {exc}")
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_url = {executor.submit(run_with_context, main, url, site=get_site(url)): url for url in websites}
+            for future in as_completed(future_to_url):
+                url = future_to_url[future]
+                try:
+                    future.result()
+                    logger.info(f"Completed processing for {url}")
+                except Exception as exc:
+                    logger.error(f"Processing for {url} generated an exception: {exc}")
+    finally:
+        shutdown_driver_pool()
+        finalize_results()
+        log_ranker_report()
+        log_limiter_report()
+        log_cache_report()
+        log_filter_report()
+        log_provider_report()
+        log_batch_report()
+        write_metrics_report()
+
+def add_cache_arguments(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--cache-only', action='store_true', help="Only use cached pages, never fetch")
+    group.add_argument('--refresh', action='store_true', help="Fetch every page again and refresh the cache")
+
+def apply_cache_arguments(args):
+    if args.cache_only:
+        set_cache_mode('cache-only')
+    elif args.refresh:
+        set_cache_mode('refresh')
 
 if __name__ == "__main__":
-    csv_path = 'data/websites.csv'
-    process_websites(csv_path)
+    parser = argparse.ArgumentParser(description="Scrape room listings from the websites in a CSV file")
+    parser.add_argument('csv_path', nargs='?', default='data/websites.csv')
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    apply_cache_arguments(args)
+    process_websites(args.csv_path)
     
     # main('https://www.kipsbaycourt.com/')
@@ -0,0 +1,166 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+from logger_config import logger
+from url_utils import canonical_key
+
+load_dotenv()
+
+CACHE_DIR = os.getenv('PAGE_CACHE_DIR', os.path.join('cache', 'pages'))
+CACHE_TTL = float(os.getenv('PAGE_CACHE_TTL_HOURS', 24)) * 3600
+CACHE_MAX_BYTES = int(float(os.getenv('PAGE_CACHE_MAX_MB', 500)) * 1024 * 1024)
+CACHE_MODES = ('normal', 'cache-only', 'refresh', 'off')
+
+_mode = os.getenv('PAGE_CACHE_MODE', 'normal').lower()
+_total_bytes = None
+_lock = threading.Lock()
+
+
+def set_cache_mode(mode):
+    """'normal' reads through the cache, 'cache-only' never fetches,
+    'refresh' always fetches and overwrites, 'off' bypasses the cache."""
+    global _mode
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown page cache mode: {mode}")
+    _mode = mode
+    logger.info(f"Page cache mode set to: {mode}")
+
+
+def get_cache_mode():
+    return _mode
+
+
+def cache_key(url):
+    return hashlib.sha256(canonical_key(url).encode('utf-8')).hexdigest()
+
+
+def _index_path(key):
+    return os.path.join(CACHE_DIR, 'index', key[:2], f"{key}.json")
+
+
+def _blob_path(digest):
+    return os.path.join(CACHE_DIR, 'blobs', digest[:2], f"{digest}.html.gz")
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _scan_blobs():
+    blobs = []
+    blob_dir = os.path.join(CACHE_DIR, 'blobs')
+    for root, _, files in os.walk(blob_dir):
+        for name in files:
+            if not name.endswith('.html.gz'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+    return blobs
+
+
+def _get_total_bytes():
+    global _total_bytes
+    if _total_bytes is None:
+        _total_bytes = sum(size for _, size, _ in _scan_blobs())
+    return _total_bytes
+
+
+def _evict():
+    """Drop least recently used blobs until the cache is back under 90% of its size limit."""
+    global _total_bytes
+    if _get_total_bytes() <= CACHE_MAX_BYTES:
+        return
+
+    target = CACHE_MAX_BYTES * 0.9
+    evicted = 0
+    for _, size, path in sorted(_scan_blobs()):
+        if _total_bytes <= target:
+            break
+        try:
+            os.remove(path)
+            _total_bytes -= size
+            evicted += 1
+        except FileNotFoundError:
+            continue
+    logger.info(f"Evicted {evicted} pages from page cache ({_total_bytes / 1024 / 1024:.1f} MB left)")
+
+
+def get_cached_page(url):
+    if _mode in ('refresh', 'off'):
+        return None
+
+    try:
+        with open(_index_path(cache_key(url)), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Unreadable page cache entry for {url}: {e}")
+        return None
+
+    # Cache-only runs accept stale pages rather than failing the site
+    if _mode != 'cache-only' and time.time() - meta['fetched_at'] > CACHE_TTL:
+        logger.info(f"Page cache entry expired for {url}")
+        return None
+
+    blob_path = _blob_path(meta['content_hash'])
+    try:
+        with open(blob_path, 'rb') as f:
+            html = gzip.decompress(f.read()).decode('utf-8')
+        os.utime(blob_path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Unreadable page cache blob for {url}: {e}")
+        return None
+
+    logger.info(f"Page cache hit for {url} (tier: {meta.get('tier')})")
+    return {**meta, 'html': html, 'cached': True}
+
+
+def store_page(page):
+    global _total_bytes
+    if _mode == 'off' or not page or not page.get('html'):
+        return
+
+    try:
+        html = page['html'].encode('utf-8')
+        digest = hashlib.sha256(html).hexdigest()
+        meta = {
+            'url': page['url'],
+            'final_url': page.get('final_url'),
+            'status': page.get('status'),
+            'tier': page.get('tier'),
+            'fetched_at': time.time(),
+            'content_hash': digest,
+        }
+
+        with _lock:
+            blob_path = _blob_path(digest)
+            if os.path.exists(blob_path):
+                os.utime(blob_path)
+            else:
+                data = gzip.compress(html)
+                _atomic_write(blob_path, data)
+                _total_bytes = _get_total_bytes() + len(data)
+
+            encoded_meta = json.dumps(meta).encode('utf-8')
+            for url in {page['url'], page.get('final_url') or page['url']}:
+                _atomic_write(_index_path(cache_key(url)), encoded_meta)
+
+            _evict()
+        logger.debug(f"Stored page in cache: {page['url']}")
+    except Exception as e:
+        logger.error(f"Failed to store page in cache: {e}")
@@ -0,0 +1,236 @@
+from functools import cached_property
+from lxml import etree
+from logger_config import logger
+
+# Subtrees that never carry listing text
+NON_CONTENT_TAGS = {"head", "script", "style", "input", "textarea", "iframe", "noscript", "svg", "img", "br", "template"}
+
+# Elements whose text starts on a new line in the extracted text
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "fieldset", "figcaption",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main",
+    "nav", "ol", "p", "pre", "section", "table", "tbody", "thead", "tr", "ul",
+}
+
+NAV_TAGS = {"nav", "header"}
+
+
+class AnchorTarget:
+    """lxml parser target collecting anchors without building a tree.
+
+    An anchor is emitted when it closes, when the next anchor starts or when
+    its parent closes: for unclosed anchors such as ``<li><a href=/a>A<li><a
+    href=/b>B`` libxml2 nests the second item inside the first anchor."""
+
+    def __init__(self):
+        self.anchors = []
+        self._current = None
+        self._current_depth = 0
+        self._nav_stack = []
+        self._nav_depth = 0
+
+    def _flush(self):
+        self._current['text'] = ' '.join(' '.join(self._current['text']).split())
+        self.anchors.append(self._current)
+        self._current = None
+
+    def start(self, tag, attrib):
+        if tag == 'a' and self._current is not None:
+            self._flush()
+        is_nav = tag in NAV_TAGS or attrib.get('role') == 'navigation'
+        self._nav_stack.append(is_nav)
+        self._nav_depth += is_nav
+        if tag == 'a' and attrib.get('href'):
+            self._current = {
+                'href': attrib['href'].strip(),
+                'text': [],
+                'in_nav': self._nav_depth > 0,
+                'position': len(self.anchors),
+            }
+            self._current_depth = len(self._nav_stack)
+
+    def end(self, tag):
+        if self._nav_stack:
+            self._nav_depth -= self._nav_stack.pop()
+        # The anchor's own end tag, or a parent closing over an unclosed anchor
+        if self._current is not None and len(self._nav_stack) < self._current_depth:
+            self._flush()
+
+    def data(self, data):
+        if self._current is not None:
+            self._current['text'].append(data)
+
+    def close(self):
+        if self._current is not None:
+            self._flush()
+        return self.anchors
+
+
+class TextTarget:
+    """lxml parser target producing page text in one pass, skipping
+    non-content subtrees and putting block elements on their own lines."""
+
+    def __init__(self):
+        self.lines = []
+        self._line = []
+        self._skip_depth = 0
+
+    def _break(self):
+        if self._line:
+            self.lines.append(' '.join(self._line))
+            self._line = []
+
+    def start(self, tag, attrib):
+        if tag in NON_CONTENT_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS and not self._skip_depth:
+            self._break()
+
+    def end(self, tag):
+        if tag in NON_CONTENT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS and not self._skip_depth:
+            self._break()
+
+    def data(self, data):
+        if not self._skip_depth:
+            text = ' '.join(data.split())
+            if text:
+                self._line.append(text)
+
+    def close(self):
+        self._break()
+        return '\n'.join(self.lines)
+
+
+class IframeTarget:
+    def __init__(self):
+        self.srcs = []
+
+    def start(self, tag, attrib):
+        if tag == 'iframe' and attrib.get('src'):
+            self.srcs.append(attrib['src'].strip())
+
+    def end(self, tag):
+        pass
+
+    def close(self):
+        return self.srcs
+
+
+def parse_with_target(html, target):
+    if not html:
+        return target.close()
+    parser = etree.HTMLParser(target=target, recover=True, no_network=True)
+    try:
+        parser.feed(html)
+        return parser.close()
+    except etree.LxmlError as e:
+        logger.warning(f"HTML parsing stopped early: {e}")
+        return target.close()
+
+
+def extract_anchors(html):
+    return parse_with_target(html, AnchorTarget())
+
+
+def extract_text(html):
+    return parse_with_target(html, TextTarget())
+
+
+def extract_iframe_srcs(html):
+    return parse_with_target(html, IframeTarget())
+
+
+class ParsedPage:
+    """Raw HTML plus views that are built on first use and never share a tree."""
+
+    def __init__(self, html, url=None, meta=None):
+        self.html = html
+        self.url = url
+        self.meta = meta or {}
+
+    @cached_property
+    def anchors(self):
+        return extract_anchors(self.html)
+
+    @cached_property
+    def text(self):
+        return extract_text(self.html)
+
+    @cached_property
+    def iframe_srcs(self):
+        return extract_iframe_srcs(self.html)
+
+
+def benchmark(pages, repeat=3):
+    """Compare the html.parser soup path against the lxml targets on saved pages."""
+    import time
+    import tracemalloc
+    from bs4 import BeautifulSoup
+
+    def soup_path(html):
+        soup = BeautifulSoup(html, 'html.parser')
+        links = [link['href'] for link in soup.find_all('a', href=True)]
+        for tag in soup(list(NON_CONTENT_TAGS)):
+            tag.decompose()
+        return links, soup.get_text(separator=' ', strip=True)
+
+    def lxml_path(html):
+        page = ParsedPage(html)
+        return [anchor['href'] for anchor in page.anchors], page.text
+
+    results = {}
+    for name, run in (("BeautifulSoup html.parser", soup_path), ("lxml targets", lxml_path)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for html in pages:
+                run(html)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {'seconds_per_page': elapsed / (repeat * len(pages)), 'peak_mb': peak / 1024 / 1024}
+        print(f"{name}: {results[name]['seconds_per_page'] * 1000:.1f} ms/page, peak {results[name]['peak_mb']:.1f} MB")
+    return results
+
+
+def self_test():
+    """Check anchor extraction on well-formed and unclosed markup."""
+    cases = [
+        ("<ul><li><a href=/a>A</a></li><li><a href=/b>B</a></li></ul>", [('/a', 'A'), ('/b', 'B')]),
+        ("<ul><li><a href=/a>A<li><a href=/b>B</ul>", [('/a', 'A'), ('/b', 'B')]),
+        ("<p><a href=/a>A <b>bold</b><a href=/b>B</p><p>after</p>", [('/a', 'A bold'), ('/b', 'B')]),
+        ("<div><a href=/a>A</div><p>not a link</p><a href=/b>B", [('/a', 'A'), ('/b', 'B')]),
+        ("<nav><a href=/>Home</nav><a href=/rooms>Rooms</a>", [('/', 'Home'), ('/rooms', 'Rooms')]),
+    ]
+    for html, expected in cases:
+        anchors = extract_anchors(html)
+        found = [(anchor['href'], anchor['text']) for anchor in anchors]
+        assert found == expected, f"{html!r}: expected {expected}, got {found}"
+        assert [anchor['position'] for anchor in anchors] == list(range(len(anchors)))
+    nav = extract_anchors(cases[-1][0])
+    assert nav[0]['in_nav'] and not nav[1]['in_nav'], nav
+    logger.info(f"Page parser self-test passed ({len(cases)} cases)")
+
+
+if __name__ == "__main__":
+    import sys
+
+    self_test()
+
+    if len(sys.argv) > 1:
+        saved_pages = []
+        for path in sys.argv[1:]:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                saved_pages.append(f.read())
+    else:
+        card = (
+            "<div class='card'><img src='room.jpg'><h3>Deluxe Suite {i}</h3>"
+            "<p>123 Main St, Asheville, NC</p><p>$1,{i:03d}/month &middot; 2 beds &middot; 1 bath</p>"
+            "<a href='/rooms/{i}'>View</a><script>track({i})</script></div>"
+        )
+        body = ''.join(card.format(i=i) for i in range(5000))
+        saved_pages = [f"<html><head><style>.card{{}}</style></head><body><nav><a href='/'>Home</a></nav>{body}</body></html>"]
+
+    benchmark(saved_pages)
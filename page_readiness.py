@@ -0,0 +1,177 @@
+import os
+import time
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+# Installed on every new document: records DOM mutations and in-flight
+# fetch/XHR requests so readiness can be polled instead of slept on.
+PROBE_SCRIPT = """
+(function () {
+  if (window.__scraperProbe) { return; }
+  var probe = window.__scraperProbe = {inflight: {}, nextId: 0, lastActivity: Date.now()};
+  function touch() { probe.lastActivity = Date.now(); }
+  function start() { var id = probe.nextId++; probe.inflight[id] = Date.now(); touch(); return id; }
+  function done(id) { delete probe.inflight[id]; touch(); }
+  probe.state = function (staleMs) {
+    var now = Date.now(), pending = 0;
+    for (var id in probe.inflight) {
+      if (now - probe.inflight[id] < staleMs) { pending++; }
+    }
+    return {
+      ready: document.readyState,
+      height: document.body ? document.body.scrollHeight : 0,
+      pending: pending,
+      last: probe.lastActivity,
+      now: now
+    };
+  };
+  new MutationObserver(touch).observe(document, {childList: true, subtree: true, characterData: true});
+  if (window.fetch) {
+    var originalFetch = window.fetch;
+    window.fetch = function () {
+      var id = start();
+      return originalFetch.apply(this, arguments).then(
+        function (response) { done(id); return response; },
+        function (error) { done(id); throw error; }
+      );
+    };
+  }
+  var originalSend = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function () {
+    var id = start();
+    this.addEventListener('loadend', function () { done(id); });
+    return originalSend.apply(this, arguments);
+  };
+})();
+"""
+
+STATE_SCRIPT = """
+if (!window.__scraperProbe) { return null; }
+return window.__scraperProbe.state(arguments[0]);
+"""
+
+SCROLL_SCRIPT = """
+window.scrollTo(0, document.body.scrollHeight);
+return Date.now();
+"""
+
+PAGE_TIME_BUDGET = float(os.getenv('WAITING_TIME', 30))
+
+# budget: hard limit in seconds for loading, settling and scrolling one page
+# quiet_period: seconds without DOM mutations or network activity to call the page settled
+# request_timeout: in-flight requests older than this (seconds) stop counting as pending
+# max_scrolls: cap on scroll-to-bottom iterations for infinite-scroll pages
+# scroll_tolerance: relative height change below which scrolling stops
+READINESS_PROFILES = {
+    'default': {
+        'budget': PAGE_TIME_BUDGET,
+        'quiet_period': 0.3,
+        'poll_interval': 0.1,
+        'request_timeout': 5,
+        'max_scrolls': 10,
+        'scroll_tolerance': 0.05,
+    },
+    'strict': {
+        'budget': min(PAGE_TIME_BUDGET, 10),
+        'quiet_period': 0.2,
+        'poll_interval': 0.05,
+        'request_timeout': 3,
+        'max_scrolls': 3,
+        'scroll_tolerance': 0.05,
+    },
+    'relaxed': {
+        'budget': PAGE_TIME_BUDGET * 2,
+        'quiet_period': 1.0,
+        'poll_interval': 0.2,
+        'request_timeout': 10,
+        'max_scrolls': 25,
+        'scroll_tolerance': 0.02,
+    },
+}
+
+
+def resolve_profile(profile=None):
+    """Accept a profile name, a dict of overrides on top of 'default', or None."""
+    resolved = dict(READINESS_PROFILES['default'])
+    if profile is None:
+        return resolved
+    if isinstance(profile, str):
+        if profile not in READINESS_PROFILES:
+            logger.warning(f"Unknown readiness profile '{profile}', using default")
+            return resolved
+        resolved.update(READINESS_PROFILES[profile])
+        return resolved
+    resolved.update(profile)
+    return resolved
+
+
+def install_probe(driver):
+    """Register the probe for every document the browser loads from now on."""
+    try:
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': PROBE_SCRIPT})
+    except Exception as e:
+        logger.warning(f"Could not register readiness probe, it will be injected after load: {e}")
+
+
+def read_state(driver, profile):
+    state = driver.execute_script(STATE_SCRIPT, int(profile['request_timeout'] * 1000))
+    if state is None:
+        # Probe was not registered before navigation; late injection still
+        # tracks mutations and requests from this point on.
+        driver.execute_script(PROBE_SCRIPT)
+        state = driver.execute_script(STATE_SCRIPT, int(profile['request_timeout'] * 1000))
+    return state
+
+
+def wait_for_quiet(driver, profile, deadline, since=0):
+    """Poll until the document is complete, the network is idle and the DOM
+    has not changed for ``quiet_period`` seconds (measured from ``since``, a
+    browser timestamp in ms). Returns the last state and whether it settled."""
+    quiet_ms = profile['quiet_period'] * 1000
+    while True:
+        state = read_state(driver, profile)
+        settled_at = max(state['last'], since)
+        if state['ready'] == 'complete' and state['pending'] == 0 and state['now'] - settled_at >= quiet_ms:
+            return state, True
+        if time.monotonic() >= deadline:
+            return state, False
+        time.sleep(profile['poll_interval'])
+
+
+def load_page(driver, url, profile=None):
+    """Navigate to ``url`` and block until it is ready, within the profile's budget."""
+    from selenium.common.exceptions import TimeoutException
+    profile = resolve_profile(profile)
+    start = time.monotonic()
+    deadline = start + profile['budget']
+
+    driver.set_page_load_timeout(max(1, profile['budget']))
+    try:
+        driver.get(url)
+    except TimeoutException:
+        logger.warning(f"Page load exceeded budget for {url}, using what has loaded so far")
+        driver.execute_script("window.stop();")
+
+    state, settled = wait_for_quiet(driver, profile, deadline)
+    last_height = state['height']
+    scrolls = 0
+
+    while settled and scrolls < profile['max_scrolls'] and time.monotonic() < deadline:
+        scrolled_at = driver.execute_script(SCROLL_SCRIPT)
+        scrolls += 1
+        state, settled = wait_for_quiet(driver, profile, deadline, since=scrolled_at)
+        new_height = state['height']
+        if abs(new_height - last_height) <= profile['scroll_tolerance'] * last_height:
+            break
+        last_height = new_height
+
+    elapsed = time.monotonic() - start
+    if not settled:
+        logger.warning(f"Page readiness budget exhausted for {url} (elapsed: {elapsed:.2f}s, scrolls: {scrolls})")
+    elif scrolls >= profile['max_scrolls']:
+        logger.warning(f"Scroll cap reached for {url} (elapsed: {elapsed:.2f}s, scrolls: {scrolls})")
+    else:
+        logger.info(f"Page ready for {url} in {elapsed:.2f}s after {scrolls} scrolls")
+    return {'elapsed': elapsed, 'scrolls': scrolls, 'timed_out': not settled}
@@ -1,11 +1,19 @@
 import pandas as pd
 import os
-from geolocation import get_address_details
+from geolocation import iter_geocoded, log_geocoding_report
+from geocode_cache import log_geocode_cache_report
 from logger_config import logger
+from save_data import USE_DB
+
+ALLOWED_COLUMNS = ['Full_Address', 'Street_Number', 'Street_Name', 'Zipcode',
+                   'State', 'City', 'County', 'Latitude', 'Longitude']
+# Results are written back every N geocoded addresses, so an interrupted run resumes where it stopped
+CHECKPOINT_ADDRESSES = int(os.getenv('GEOCODE_CHECKPOINT_ADDRESSES', 100))
 
 def load_csv(file_path):
     try:
-        df = pd.read_csv(file_path)
+        # Read address columns as text: columns that are still empty would otherwise be float and reject strings
+        df = pd.read_csv(file_path, dtype={column: 'object' for column in ALLOWED_COLUMNS if column not in ('Latitude', 'Longitude')})
         logger.info(f"Loaded CSV file with {len(df)} rows")
         return df
     except Exception as e:
@@ -28,16 +36,13 @@ def filter_rows_to_process(df, max_rows):
     
     return rows_to_process
 
-def process_row(row):
-    allowed_columns = ['Full_Address', 'Street_Number', 'Street_Name', 'Zipcode',
-                       'State', 'City', 'County', 'Latitude', 'Longitude']
-    
+def process_row(row, details_by_address):
     if pd.isna(row['Latitude']) and pd.isna(row['Longitude']):
         address = row['Website_Address']
         if pd.notna(address):
-            details = get_address_details(address)
+            details = details_by_address.get(address)
             if details:
-                filtered_details = {k: v if v is not None else '' for k, v in details.items() if k in allowed_columns}
+                filtered_details = {k: v if v is not None else '' for k, v in details.items() if k in ALLOWED_COLUMNS}
                 if any(filtered_details.values()):
                     row.update(filtered_details)
                 else:
@@ -48,21 +53,88 @@ def process_row(row):
             logger.warning(f"Skipping row with empty Website_Address")
     return row
 
+def apply_details(df, rows_to_process, details_by_address):
+    done = rows_to_process[rows_to_process['Website_Address'].isin(details_by_address.keys())]
+    if len(done):
+        df.update(done.apply(process_row, axis=1, args=(details_by_address,)))
+
 def process_data(file_path, max_rows):
     df = load_csv(file_path)
     if df is None:
         return
 
     rows_to_process = filter_rows_to_process(df, max_rows)
-    processed_df = rows_to_process.apply(process_row, axis=1)
+    for column in ('Latitude', 'Longitude'):
+        df[column] = df[column].astype('object')
+    # Each distinct address is geocoded once, however many rows share it; results
+    # arrive in row order and are checkpointed to the file as they complete
+    details_by_address = {}
+    for address, details in iter_geocoded(rows_to_process['Website_Address'].dropna()):
+        details_by_address[address] = details
+        if len(details_by_address) >= CHECKPOINT_ADDRESSES:
+            apply_details(df, rows_to_process, details_by_address)
+            save_csv(file_path, df)
+            details_by_address = {}
 
-    df.update(processed_df)
+    apply_details(df, rows_to_process, details_by_address)
     save_csv(file_path, df)
 
+def details_update(row, details):
+    """Columns to write for ``row``, or None (with a warning) when there is nothing to write."""
+    address = row['Website_Address']
+    if not details:
+        logger.warning(f"No details returned for address: {address}")
+        return None
+    filtered_details = {k: v for k, v in details.items() if k in ALLOWED_COLUMNS and v is not None}
+    if not any(filtered_details.values()):
+        logger.warning(f"No valid details found for address: {address}")
+        return None
+    return filtered_details
+
+def process_db(max_rows):
+    """Geocode listings in the result database, writing back only the rows that got details."""
+    from result_db import rows_missing_coordinates, update_listings
+
+    rows = rows_missing_coordinates(max_rows)
+    logger.info(f"Rows with empty Latitude and Longitude: {len(rows)} (max_rows: {max_rows})")
+    rows_by_address = {}
+    for row in rows:
+        if row['Website_Address']:
+            rows_by_address.setdefault(row['Website_Address'], []).append(row)
+        else:
+            logger.warning("Skipping row with empty Website_Address")
+
+    changed = 0
+    updates = []
+    geocoded = 0
+    for address, details in iter_geocoded(rows_by_address):
+        for row in rows_by_address[address]:
+            values = details_update(row, details)
+            if values:
+                updates.append((row, values))
+        geocoded += 1
+        if geocoded % CHECKPOINT_ADDRESSES == 0:
+            changed += update_listings(updates)
+            updates = []
+    changed += update_listings(updates)
+    logger.info(f"Updated {changed} rows in the result database")
+
+def process_addresses(file_path, max_rows):
+    """Geocode rows missing coordinates in whichever result backend RESULT selects,
+    then log the provider and cache summary."""
+    try:
+        if USE_DB:
+            process_db(max_rows)
+        else:
+            process_data(file_path, max_rows)
+    finally:
+        log_geocoding_report()
+        log_geocode_cache_report()
+
 if __name__ == "__main__":
     file_path = "results/results.csv"
     max_rows = int(os.getenv('MAX_ADDRESS_ROWS', 100))
 
     logger.info("Starting address processing")
-    process_data(file_path, max_rows)
+    process_addresses(file_path, max_rows)
     logger.info("Address processing completed")
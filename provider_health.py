@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+from collections import deque
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+# Consecutive failures that open a provider's circuit, and how long it stays open
+BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", 3))
+BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", 60))
+# Successful calls remembered per provider for latency percentiles
+LATENCY_WINDOW = 200
+# Hedge only once the primary has this many latency samples to derive a p95 from
+HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", 20))
+
+
+class ProviderHealth:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.served = 0
+        self.failures = 0
+        self.breaker_opens = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.repairs = 0
+        self.repairs_ok = 0
+        self.total_latency = 0.0
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_health(provider):
+    with _health_lock:
+        return _health.setdefault(provider, ProviderHealth())
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def allow_call(provider):
+    """Closed circuits always allow calls; an open one allows a single trial once it cools down."""
+    health = get_health(provider)
+    with health.lock:
+        if health.consecutive_failures < BREAKER_FAILURES:
+            return True
+        if time.monotonic() < health.open_until or health.trial_in_flight:
+            return False
+        health.trial_in_flight = True
+        return True
+
+
+def record_success(provider, latency):
+    health = get_health(provider)
+    with health.lock:
+        if health.consecutive_failures >= BREAKER_FAILURES:
+            logger.info(f"{provider} recovered, closing its circuit")
+        health.consecutive_failures = 0
+        health.trial_in_flight = False
+        health.latencies.append(latency)
+        health.served += 1
+        health.total_latency += latency
+
+
+def record_failure(provider):
+    health = get_health(provider)
+    with health.lock:
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.trial_in_flight = False
+        if health.consecutive_failures >= BREAKER_FAILURES:
+            health.open_until = time.monotonic() + BREAKER_COOLDOWN
+            health.breaker_opens += 1
+            logger.warning(
+                f"{provider} failed {health.consecutive_failures} times in a row, "
+                f"skipping it for {BREAKER_COOLDOWN:g}s"
+            )
+
+
+def hedge_delay(provider):
+    """Seconds to wait on ``provider`` before also asking the next one, or None
+    while there are too few samples to know its p95."""
+    health = get_health(provider)
+    with health.lock:
+        if len(health.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(health.latencies, 0.95)
+
+
+def record_hedge(provider, won):
+    """Count a hedge fired because ``provider`` was slow, and whether the backup answered first."""
+    health = get_health(provider)
+    with health.lock:
+        health.hedges_fired += 1
+        health.hedges_won += bool(won)
+
+
+def record_repair(provider, ok):
+    health = get_health(provider)
+    with health.lock:
+        health.repairs += 1
+        health.repairs_ok += bool(ok)
+
+
+def get_provider_stats():
+    with _health_lock:
+        items = list(_health.items())
+    stats = {}
+    for provider, health in items:
+        with health.lock:
+            stats[provider] = {
+                "served": health.served,
+                "failures": health.failures,
+                "breaker_opens": health.breaker_opens,
+                "hedges_fired": health.hedges_fired,
+                "hedges_won": health.hedges_won,
+                "repairs": health.repairs,
+                "repairs_ok": health.repairs_ok,
+                "latency_avg": round(health.total_latency / health.served, 3) if health.served else 0.0,
+                "latency_p50": round(percentile(health.latencies, 0.5), 3),
+                "latency_p95": round(percentile(health.latencies, 0.95), 3),
+            }
+    return stats
+
+
+def log_provider_report():
+    for provider, stats in get_provider_stats().items():
+        logger.info(
+            f"AI provider {provider}: served {stats['served']} calls, {stats['failures']} failures, "
+            f"latency avg {stats['latency_avg']:.2f}s p50 {stats['latency_p50']:.2f}s p95 {stats['latency_p95']:.2f}s, "
+            f"circuit opened {stats['breaker_opens']} times, hedged {stats['hedges_fired']} slow calls ({stats['hedges_won']} answered by the backup), "
+            f"{stats['repairs_ok']}/{stats['repairs']} malformed replies repaired"
+        )
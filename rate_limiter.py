@@ -0,0 +1,155 @@
+import os
+import time
+import random
+import threading
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+# Requests and tokens per minute for each provider, applied per (provider, model)
+DEFAULT_LIMITS = {
+    "groq": {"rpm": 30, "tpm": 6000},
+    "gemini": {"rpm": 15, "tpm": 1000000},
+    # Google Sheets write requests per minute per user; tokens are not counted
+    "sheets": {"rpm": 60, "tpm": 1000000},
+    # Geocoders enforce per-second limits, so their bursts are capped too:
+    # OpenCage's free tier allows 1 request/s, Google 50/s
+    "opencage": {"rpm": 60, "tpm": 1000000, "burst": 1},
+    "google": {"rpm": 3000, "tpm": 1000000, "burst": 50},
+}
+# Allowance for the reply when estimating a call's tokens up front
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("AI_COMPLETION_TOKEN_ESTIMATE", 512))
+BACKOFF_BASE = float(os.getenv("AI_BACKOFF_BASE", 2))
+BACKOFF_MAX = float(os.getenv("AI_BACKOFF_MAX", 60))
+
+
+class RateLimited(Exception):
+    """Raised by a provider call that was rejected with a 429."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, capacity, per_minute):
+        self.capacity = max(1.0, float(capacity))
+        self.rate = max(1.0, float(per_minute)) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Take ``amount`` now, going into debt if needed; returns seconds to wait."""
+        self._refill(now)
+        amount = min(float(amount), self.capacity)
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class ProviderLimiter:
+    def __init__(self, rpm, tpm, burst=None):
+        # Requests allowed back to back; a full minute's worth unless the provider limits bursts
+        self.requests = TokenBucket(burst or rpm, rpm)
+        self.tokens = TokenBucket(tpm, tpm)
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.rate_limited = 0
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limits(provider):
+    defaults = DEFAULT_LIMITS.get(provider, {"rpm": 30, "tpm": 100000})
+    prefix = provider.upper()
+    return (
+        int(os.getenv(f"{prefix}_RPM", defaults["rpm"])),
+        int(os.getenv(f"{prefix}_TPM", defaults["tpm"])),
+    )
+
+
+def get_limiter(provider, model):
+    key = (provider, model or "")
+    with _limiters_lock:
+        if key not in _limiters:
+            rpm, tpm = get_limits(provider)
+            burst = os.getenv(f"{provider.upper()}_BURST", DEFAULT_LIMITS.get(provider, {}).get("burst"))
+            _limiters[key] = ProviderLimiter(rpm, tpm, int(burst) if burst else None)
+            logger.info(f"Rate limiter for {provider}/{model}: {rpm} requests/min, {tpm} tokens/min")
+        return _limiters[key]
+
+
+def estimate_tokens(*texts):
+    """Rough token count (about 4 characters per token) plus a reply allowance."""
+    return sum(len(text or '') for text in texts) // 4 + COMPLETION_TOKEN_ESTIMATE
+
+
+def acquire(provider, model, tokens):
+    """Block until a call of ``tokens`` fits the provider quota; returns seconds waited."""
+    limiter = get_limiter(provider, model)
+    with limiter.lock:
+        now = time.monotonic()
+        wait = max(
+            limiter.requests.reserve(1, now),
+            limiter.tokens.reserve(tokens, now),
+            limiter.blocked_until - now,
+        )
+        limiter.calls += 1
+        limiter.total_wait += wait
+        limiter.max_wait = max(limiter.max_wait, wait)
+
+    if wait > 0:
+        logger.debug(f"Waiting {wait:.2f}s for {provider}/{model} quota")
+        time.sleep(wait)
+    return wait
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Jittered exponential backoff, never shorter than a server-sent Retry-After."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    delay *= random.uniform(0.5, 1.5)
+    if retry_after:
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+def report_rate_limited(provider, model, delay):
+    """Pause every caller of this provider/model after a 429."""
+    limiter = get_limiter(provider, model)
+    with limiter.lock:
+        limiter.rate_limited += 1
+        limiter.blocked_until = max(limiter.blocked_until, time.monotonic() + delay)
+    logger.warning(f"{provider}/{model} rate limited, pausing calls for {delay:.1f}s")
+
+
+def get_limiter_stats():
+    with _limiters_lock:
+        items = list(_limiters.items())
+    stats = {}
+    for (provider, model), limiter in items:
+        with limiter.lock:
+            stats[f"{provider}/{model}"] = {
+                "calls": limiter.calls,
+                "queue_wait_total": round(limiter.total_wait, 3),
+                "queue_wait_avg": round(limiter.total_wait / limiter.calls, 3) if limiter.calls else 0.0,
+                "queue_wait_max": round(limiter.max_wait, 3),
+                "rate_limited": limiter.rate_limited,
+            }
+    return stats
+
+
+def log_limiter_report():
+    for key, stats in get_limiter_stats().items():
+        logger.info(
+            f"Rate limiter {key}: {stats['calls']} calls, queue wait avg {stats['queue_wait_avg']:.2f}s "
+            f"(max {stats['queue_wait_max']:.2f}s), {stats['rate_limited']} rate limited responses"
+        )
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import hashlib
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+from logger_config import logger
+from connect_ai import (
+    connect_to_ai, route_call, get_provider_order, get_cached_reply, store_reply, get_groq_client, AI_JSON_MODE,
+)
+from schemas import batch_schema, parse_and_validate, validate
+from text_chunker import count_tokens
+from llm_metrics import call_context, get_call_context, record_call
+
+load_dotenv()
+
+BATCHING_ENABLED = os.getenv("AI_BATCHING", "false").lower() == "true"
+# Segments larger than this are sent on their own; batching pays off for small pages
+BATCH_SEGMENT_MAX_TOKENS = int(os.getenv("AI_BATCH_SEGMENT_MAX_TOKENS", 1500))
+BATCH_MAX_TOKENS = int(os.getenv("AI_BATCH_MAX_TOKENS", 6000))
+BATCH_MAX_SEGMENTS = int(os.getenv("AI_BATCH_MAX_SEGMENTS", 8))
+# Seconds the oldest segment may wait for others before its batch is sent anyway
+BATCH_MAX_WAIT = float(os.getenv("AI_BATCH_MAX_WAIT", 1.0))
+BATCH_WORKERS = int(os.getenv("AI_BATCH_WORKERS", 4))
+# 'groq' submits batches through the Groq Batch API (discounted, but asynchronous)
+BATCH_API = os.getenv("AI_BATCH_API", "none").lower()
+BATCH_COMPLETION_WINDOW = os.getenv("AI_BATCH_COMPLETION_WINDOW", "24h")
+BATCH_POLL_INTERVAL = float(os.getenv("AI_BATCH_POLL_INTERVAL", 30))
+
+BATCH_INSTRUCTIONS = """
+
+The input below contains several independent pages. Each one starts with a line <<<SEGMENT id>>> and ends with a line <<<END id>>>.
+Process every segment separately, exactly as described above, and return a single JSON object of the form:
+
+{"results": [{"segment": "id", "status": ..., "message": "...", "data": ...}, ...]}
+
+with one entry per segment, using the segment's id, and nothing else.
+"""
+
+GROQ_BATCH_FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+_segment_ids = itertools.count(1)
+_stats = {"batches": 0, "batched_segments": 0, "single_segments": 0, "fallback_segments": 0, "cached_segments": 0}
+_stats_lock = threading.Lock()
+
+
+def count_stat(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+class Segment:
+    def __init__(self, content, tokens, refresh):
+        self.id = f"p{next(_segment_ids)}"
+        self.content = content
+        self.tokens = tokens
+        self.refresh = refresh
+        self.future = Future()
+        # The submitter's site/stage, so usage can be attributed back to it
+        self.context = contextvars.copy_context()
+        self.labels = get_call_context()
+
+
+class RequestBatcher:
+    """Packs small requests sharing one prompt into single model calls.
+
+    Callers get a Future per request. A background thread sends the pending
+    segments once they fill the token budget or the oldest has waited
+    BATCH_MAX_WAIT seconds, and the per-segment results are routed back to
+    each Future. Segments the model leaves out are retried on their own.
+    """
+
+    def __init__(self, prompt, schema, cache_if=None):
+        self.prompt = prompt
+        self.schema = schema
+        self.cache_if = cache_if
+        self.batch_schema = batch_schema(schema)
+        self.pending = []
+        self.pending_tokens = 0
+        self.oldest = None
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="ai-batch")
+        self.thread = threading.Thread(target=self._run, name="ai-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, content, refresh=False):
+        if not refresh:
+            cached = get_cached_reply(get_provider_order(), self.prompt, content, self.schema, self.cache_if)
+            if cached:
+                count_stat("cached_segments")
+                future = Future()
+                future.set_result(cached)
+                return future
+
+        segment = Segment(content, count_tokens(content), refresh)
+        with self.condition:
+            if self.pending and self.pending_tokens + segment.tokens > BATCH_MAX_TOKENS:
+                self._flush()
+            self.pending.append(segment)
+            self.pending_tokens += segment.tokens
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            if len(self.pending) >= BATCH_MAX_SEGMENTS:
+                self._flush()
+            self.condition.notify()
+        return segment.future
+
+    def _run(self):
+        with self.condition:
+            while True:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                remaining = self.oldest + BATCH_MAX_WAIT - time.monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                self._flush()
+
+    def _flush(self):
+        """Hand the pending segments to a worker; called with the condition held."""
+        segments = self.pending
+        self.pending = []
+        self.pending_tokens = 0
+        self.oldest = None
+        self.executor.submit(self._process, segments)
+
+    def _process(self, segments):
+        results = {}
+        if len(segments) > 1:
+            try:
+                results = self._call_groq_batch_api(segments) if BATCH_API == "groq" else self._call_packed(segments)
+            except Exception as e:
+                logger.error(f"Batch of {len(segments)} segments failed: {e}")
+        else:
+            count_stat("single_segments")
+
+        for segment in segments:
+            try:
+                if segment.id in results:
+                    segment.future.set_result(results[segment.id])
+                    continue
+                if len(segments) > 1:
+                    count_stat("fallback_segments")
+                segment.future.set_result(segment.context.run(
+                    connect_to_ai, self.prompt, segment.content, refresh=segment.refresh,
+                    cache_if=self.cache_if, schema=self.schema
+                ))
+            except Exception as e:
+                segment.future.set_exception(e)
+
+    def _accept(self, provider, segment, value):
+        """Keep a per-segment result that matches the schema and passes ``cache_if``,
+        caching it as its own call would be; others are retried alone, with failover."""
+        if validate(value, self.schema) or (self.cache_if and not self.cache_if(value)):
+            return False
+        store_reply(provider, self.prompt, segment.content, json.dumps(value, ensure_ascii=False))
+        return True
+
+    def _call_packed(self, segments):
+        content = "\n\n".join(f"<<<SEGMENT {s.id}>>>\n{s.content}\n<<<END {s.id}>>>" for s in segments)
+        by_id = {segment.id: segment for segment in segments}
+        logger.info(f"Sending {len(segments)} segments (~{sum(s.tokens for s in segments)} tokens) in one AI call")
+        shares = [(s.labels.get("site"), s.labels.get("stage"), s.tokens) for s in segments]
+        with call_context(shares=shares):
+            provider, response = route_call(
+                get_provider_order(), self.prompt + BATCH_INSTRUCTIONS, content, schema=self.batch_schema
+            )
+        count_stat("batches")
+        count_stat("batched_segments", len(segments))
+        if not response:
+            return {}
+
+        results = {}
+        for entry in json.loads(response)["results"]:
+            segment = by_id.get(entry.pop("segment"))
+            if segment and segment.id not in results and self._accept(provider, segment, entry):
+                results[segment.id] = entry
+        missing = len(segments) - len(results)
+        if missing:
+            logger.warning(f"Batched reply left out {missing} of {len(segments)} segments")
+        return results
+
+    def _call_groq_batch_api(self, segments):
+        """Submit segments as one Groq Batch API job and wait for it to finish."""
+        client = get_groq_client()
+        model = os.getenv("GROQ_MODEL")
+        lines = []
+        for segment in segments:
+            body = {
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": self.prompt},
+                    {"role": "user", "content": segment.content},
+                ],
+            }
+            if AI_JSON_MODE:
+                body["response_format"] = {"type": "json_object"}
+            lines.append(json.dumps({"custom_id": segment.id, "method": "POST", "url": "/v1/chat/completions", "body": body}))
+
+        batch_file = client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        job = client.batches.create(
+            completion_window=BATCH_COMPLETION_WINDOW, endpoint="/v1/chat/completions", input_file_id=batch_file.id
+        )
+        logger.info(f"Submitted Groq batch {job.id} with {len(segments)} segments")
+        submitted = time.monotonic()
+        count_stat("batches")
+        count_stat("batched_segments", len(segments))
+        while job.status not in GROQ_BATCH_FINAL_STATES:
+            time.sleep(BATCH_POLL_INTERVAL)
+            job = client.batches.retrieve(job.id)
+        if job.status != "completed" or not job.output_file_id:
+            logger.error(f"Groq batch {job.id} ended as {job.status}")
+            return {}
+
+        by_id = {segment.id: segment for segment in segments}
+        latency = (time.monotonic() - submitted) / len(segments)
+        results = {}
+        for line in client.files.content(job.output_file_id).read().decode("utf-8").splitlines():
+            item = json.loads(line)
+            segment = by_id.get(item.get("custom_id"))
+            body = (item.get("response") or {}).get("body") or {}
+            if not segment or not body.get("choices"):
+                continue
+            usage = body.get("usage") or {}
+            segment.context.run(
+                record_call, "groq", model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), latency, 0.0
+            )
+            value, errors = parse_and_validate(body["choices"][0]["message"]["content"], self.schema)
+            if not errors and self._accept("groq", segment, value):
+                results[segment.id] = value
+        return results
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(prompt, schema, cache_if=None):
+    key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = RequestBatcher(prompt, schema, cache_if)
+        return _batchers[key]
+
+
+def should_batch(content):
+    return BATCHING_ENABLED and count_tokens(content) <= BATCH_SEGMENT_MAX_TOKENS
+
+
+def get_batch_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def log_batch_report():
+    stats = get_batch_stats()
+    if not stats["batches"]:
+        return
+    per_call = stats["batched_segments"] / stats["batches"]
+    logger.info(
+        f"AI batching: {stats['batched_segments']} segments in {stats['batches']} calls ({per_call:.1f} per call), "
+        f"{stats['single_segments']} sent alone, {stats['fallback_segments']} retried alone, "
+        f"{stats['cached_segments']} served from cache"
+    )
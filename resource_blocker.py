@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import threading
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+RESOURCE_TYPE_EXTENSIONS = {
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp'],
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'media': ['mp4', 'webm', 'mov', 'm4v', 'mp3', 'm4a', 'ogg', 'wav'],
+    'stylesheet': ['css'],
+}
+# Chrome URL patterns ('*' wildcard) per resource type. The extension must end the
+# path, so hosts such as www.movenpick.com or www.iconhotel.com are not blocked
+RESOURCE_TYPE_PATTERNS = {
+    resource_type: [pattern for extension in extensions
+                    for pattern in (f'*.{extension}', f'*.{extension}?*', f'*.{extension}#*')]
+    for resource_type, extensions in RESOURCE_TYPE_EXTENSIONS.items()
+}
+
+TRACKER_HOSTS = [
+    'google-analytics.com',
+    'googletagmanager.com',
+    'googlesyndication.com',
+    'googleadservices.com',
+    'doubleclick.net',
+    'connect.facebook.net',
+    'hotjar.com',
+    'clarity.ms',
+    'segment.com',
+    'segment.io',
+    'mixpanel.com',
+    'fullstory.com',
+    'bat.bing.com',
+    'analytics.tiktok.com',
+    'snap.licdn.com',
+    'adsrvr.org',
+    'criteo.com',
+    'criteo.net',
+    'taboola.com',
+    'outbrain.com',
+    'quantserve.com',
+    'scorecardresearch.com',
+    'nr-data.net',
+]
+# A tracker host or any of its subdomains, matched at a host boundary
+TRACKER_PATTERNS = [pattern for host in TRACKER_HOSTS for pattern in (f'*://{host}/*', f'*://*.{host}/*')]
+
+# Rough transfer sizes used to estimate what a blocked request would have cost
+AVERAGE_BYTES = {
+    'Image': 40 * 1024,
+    'Font': 30 * 1024,
+    'Media': 500 * 1024,
+    'Stylesheet': 20 * 1024,
+    'Script': 25 * 1024,
+}
+DEFAULT_AVERAGE_BYTES = 5 * 1024
+
+BLOCK_RESOURCES = [t.strip().lower() for t in os.getenv('BLOCK_RESOURCES', 'image,font,media').split(',') if t.strip()]
+BLOCK_TRACKERS = os.getenv('BLOCK_TRACKERS', 'true').lower() == 'true'
+BLOCK_URL_PATTERNS = [p.strip() for p in os.getenv('BLOCK_URL_PATTERNS', '').split(',') if p.strip()]
+OVERRIDES_FILE = os.getenv('BLOCKING_OVERRIDES_FILE', os.path.join('data', 'blocking_overrides.json'))
+
+_overrides = None
+_overrides_lock = threading.Lock()
+
+
+def load_overrides():
+    """Per-domain overrides, e.g.
+    {"example.com": {"allow": ["image"], "allow_patterns": ["*://cdn.example.com/*"]},
+     "broken-site.com": {"disabled": true}}
+    """
+    global _overrides
+    with _overrides_lock:
+        if _overrides is None:
+            try:
+                with open(OVERRIDES_FILE, 'r', encoding='utf-8') as f:
+                    _overrides = json.load(f)
+                logger.info(f"Loaded resource blocking overrides for {len(_overrides)} domains")
+            except FileNotFoundError:
+                _overrides = {}
+            except Exception as e:
+                logger.error(f"Failed to load resource blocking overrides: {e}")
+                _overrides = {}
+        return _overrides
+
+
+def get_override(url):
+    host = urlparse(url).netloc.lower().split(':')[0]
+    overrides = load_overrides()
+    while host:
+        if host in overrides:
+            return overrides[host]
+        host = host.partition('.')[2]
+    return {}
+
+
+def get_blocked_patterns(url):
+    override = get_override(url)
+    if override.get('disabled'):
+        return []
+
+    allowed_types = set(override.get('allow', []))
+    allowed_patterns = set(override.get('allow_patterns', []))
+
+    patterns = []
+    for resource_type in BLOCK_RESOURCES:
+        if resource_type in allowed_types:
+            continue
+        patterns.extend(RESOURCE_TYPE_PATTERNS.get(resource_type, []))
+    if BLOCK_TRACKERS and 'tracker' not in allowed_types:
+        patterns.extend(TRACKER_PATTERNS)
+    patterns.extend(BLOCK_URL_PATTERNS)
+    patterns.extend(override.get('block_patterns', []))
+
+    return [pattern for pattern in patterns if pattern not in allowed_patterns]
+
+
+def matches_pattern(url, pattern):
+    """Chrome's blocklist matching: '*' matches any run of characters, everything else is literal."""
+    regex = '.*'.join(re.escape(part) for part in pattern.split('*'))
+    return re.fullmatch(regex, url) is not None
+
+
+def is_blocked(url, page_url=None):
+    """Whether a request to ``url`` would be blocked while rendering ``page_url``."""
+    return any(matches_pattern(url, pattern) for pattern in get_blocked_patterns(page_url or url))
+
+
+def configure_options(chrome_options):
+    """Turn on network performance logs so blocked requests can be counted."""
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    chrome_options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+
+def enable_blocking(driver):
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+    except Exception as e:
+        logger.warning(f"Could not enable network interception: {e}")
+
+
+def apply_blocking(driver, url):
+    """Set the blocklist for the next navigation and drop stale network logs."""
+    patterns = get_blocked_patterns(url)
+    try:
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+        driver.get_log('performance')
+    except Exception as e:
+        logger.warning(f"Could not apply resource blocking for {url}: {e}")
+    return patterns
+
+
+def collect_blocking_stats(driver, url):
+    """Summarise blocked requests and transferred bytes since apply_blocking."""
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        logger.warning(f"Could not read network logs for {url}: {e}")
+        return None
+
+    request_types = {}
+    blocked = {}
+    transferred = 0
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Network.requestWillBeSent':
+            request_types[params.get('requestId')] = params.get('type', 'Other')
+        elif method == 'Network.loadingFinished':
+            transferred += params.get('encodedDataLength', 0)
+        elif method == 'Network.loadingFailed' and params.get('blockedReason'):
+            resource_type = params.get('type') or request_types.get(params.get('requestId'), 'Other')
+            blocked[resource_type] = blocked.get(resource_type, 0) + 1
+
+    blocked_requests = sum(blocked.values())
+    saved_bytes = sum(AVERAGE_BYTES.get(t, DEFAULT_AVERAGE_BYTES) * n for t, n in blocked.items())
+    stats = {
+        'blocked_requests': blocked_requests,
+        'blocked_by_type': blocked,
+        'transferred_bytes': transferred,
+        'estimated_saved_bytes': saved_bytes,
+    }
+    logger.info(
+        f"Resource blocking for {url}: blocked {blocked_requests} requests "
+        f"(~{saved_bytes / 1024:.0f} KB saved), transferred {transferred / 1024:.0f} KB"
+    )
+    return stats
+
+
+def self_test():
+    """Check the blocklist against asset, tracker and look-alike hotel URLs."""
+    blocked = [
+        'https://cdn.example.com/rooms/suite.jpg',
+        'https://cdn.example.com/rooms/suite.png?w=800',
+        'https://example.com/favicon.ico',
+        'https://example.com/fonts/inter.woff2',
+        'https://example.com/tour.mov#t=10',
+        'https://www.google-analytics.com/analytics.js',
+        'https://cdn.segment.com/analytics.js/v1/key/analytics.min.js',
+        'https://segment.com/v1/t',
+    ]
+    allowed = [
+        'https://www.movenpick.com/en/',
+        'https://www.iconhotel.com/rooms',
+        'https://www.gifthouse-inn.com/',
+        'https://www.gifthouse-inn.com/api/rooms?ids=1,2',
+        'https://www.movenpick.com/hotels/rooms.html',
+        'https://www.notsegment.com/rooms',
+        'https://example.com/assets/pngquant/readme.html',
+    ]
+    wrong = [url for url in blocked if not is_blocked(url)] + [url for url in allowed if is_blocked(url)]
+    assert not wrong, f"Blocklist misclassified: {wrong}"
+    logger.info(f"Resource blocker self-test passed ({len(blocked)} blocked, {len(allowed)} allowed)")
+
+
+if __name__ == "__main__":
+    self_test()
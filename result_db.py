@@ -0,0 +1,266 @@
+import os
+import csv
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from logger_config import logger
+from save_data import FIELDNAMES, row_key
+
+load_dotenv()
+
+DB_PATH = os.getenv('RESULT_DB_PATH', os.path.join('results', 'results.sqlite'))
+# Rows per executemany() call when upserting a batch
+UPSERT_BATCH_ROWS = int(os.getenv('RESULT_DB_BATCH_ROWS', 500))
+
+# Columns filled in after scraping by the enrichment steps, exported after FIELDNAMES
+ENRICHMENT_COLUMNS = ['link']
+LISTING_COLUMNS = FIELDNAMES + ENRICHMENT_COLUMNS
+
+_local = threading.local()
+_stats = {'inserted': 0, 'updated': 0, 'errors': 0, 'enriched': 0}
+_stats_lock = threading.Lock()
+
+
+def quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def get_connection():
+    """One connection per thread; WAL lets the scraper and enrichment steps share the file."""
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        os.makedirs(os.path.dirname(DB_PATH) or '.', exist_ok=True)
+        connection = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        listing_columns = ', '.join(f"{quote(column)} TEXT DEFAULT ''" for column in LISTING_COLUMNS)
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS listings (url_key TEXT NOT NULL, address TEXT NOT NULL, '
+            f'{listing_columns}, updated_at REAL)'
+        )
+        connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS listings_key ON listings (url_key, address)')
+        error_columns = ', '.join(f"{quote(column)} TEXT DEFAULT ''" for column in FIELDNAMES)
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS errors (run TEXT NOT NULL, url_key TEXT NOT NULL, address TEXT NOT NULL, '
+            f'{error_columns}, attempts INTEGER DEFAULT 1, updated_at REAL)'
+        )
+        connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS errors_key ON errors (run, url_key, address)')
+        # Filled by geocode_cache, which uses this file when RESULT includes sqlite
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS geocodes (provider TEXT NOT NULL, address TEXT NOT NULL, '
+            'result TEXT, created_at REAL, PRIMARY KEY (provider, address))'
+        )
+        _local.connection = connection
+    return connection
+
+
+def count_stat(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fetch_existing(connection, table, keys, run=None):
+    """Current rows for ``keys`` as {key: row}, looked up through the unique index."""
+    existing = {}
+    run_clause = 'run = ? AND ' if run is not None else ''
+    for key in keys:
+        params = ((run,) if run is not None else ()) + key
+        row = connection.execute(
+            f'SELECT * FROM {table} WHERE {run_clause}url_key = ? AND address = ?', params
+        ).fetchone()
+        if row:
+            existing[key] = dict(row)
+    return existing
+
+
+def upsert_rows(table, data, run=None):
+    """Merge ``data`` into ``table`` with the CSV store's semantics: fields present
+    in a new row replace the stored ones, the rest are kept. One transaction per batch."""
+    columns = LISTING_COLUMNS if table == 'listings' else FIELDNAMES
+    current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    connection = get_connection()
+    written = 0
+    for batch in chunks(list(data), UPSERT_BATCH_ROWS):
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            existing = fetch_existing(connection, table, list(dict.fromkeys(row_key(row) for row in batch)), run)
+            merged = {}
+            for new_row in batch:
+                key = row_key(new_row)
+                current = merged.get(key) or existing.get(key)
+                if current:
+                    row = {**current, **new_row}
+                    row['Note'] = 'Data updated successfully'
+                    count_stat('updated' if table == 'listings' else 'errors')
+                else:
+                    row = dict(new_row)
+                    count_stat('inserted' if table == 'listings' else 'errors')
+                row['Timestamp'] = current_timestamp
+                merged[key] = row
+
+            params = []
+            for key, row in merged.items():
+                values = [row.get(column) if row.get(column) is not None else '' for column in columns]
+                params.append(((run,) if run is not None else ()) + key + tuple(str(v) for v in values) + (time.time(),))
+
+            key_columns = (['run'] if run is not None else []) + ['url_key', 'address']
+            all_columns = key_columns + [quote(column) for column in columns] + ['updated_at']
+            updates = ', '.join(f"{quote(column)} = excluded.{quote(column)}" for column in columns)
+            if table == 'errors':
+                updates += ', attempts = attempts + 1'
+            connection.executemany(
+                f"INSERT INTO {table} ({', '.join(all_columns)}) VALUES ({', '.join('?' * len(all_columns))}) "
+                f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}, updated_at = excluded.updated_at",
+                params,
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        written += len(merged)
+    return written
+
+
+def save_rows(filepath, data):
+    """Store rows bound for ``filepath``: results.csv maps to listings, errors-N.csv to run errors-N."""
+    run = run_name(filepath)
+    if run is None:
+        return upsert_rows('listings', data)
+    return upsert_rows('errors', data, run=run)
+
+
+def run_name(filepath):
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    return name if name.startswith('errors') else None
+
+
+def error_run_exists(filepath):
+    row = get_connection().execute('SELECT 1 FROM errors WHERE run = ? LIMIT 1', (run_name(filepath),)).fetchone()
+    return row is not None
+
+
+def error_runs():
+    return [row['run'] for row in get_connection().execute('SELECT DISTINCT run FROM errors')]
+
+
+def read_rows(table='listings', run=None, where='', params=(), limit=None):
+    columns = LISTING_COLUMNS if table == 'listings' else FIELDNAMES
+    sql = f"SELECT url_key, address, {', '.join(quote(c) for c in columns)} FROM {table}"
+    clauses = [where] if where else []
+    if run is not None:
+        clauses.append('run = ?')
+        params = tuple(params) + (run,)
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += ' ORDER BY rowid'
+    if limit is not None:
+        sql += f' LIMIT {int(limit)}'
+    return [dict(row) for row in get_connection().execute(sql, params)]
+
+
+def rows_missing_coordinates(limit=None):
+    return read_rows(where="Latitude = '' AND Longitude = ''", limit=limit)
+
+
+def update_listings(updates):
+    """Write enrichment results back; ``updates`` is a list of (row, {column: value})
+    where ``row`` came from read_rows(). Only rows whose values changed are touched."""
+    connection = get_connection()
+    changed = 0
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for row, values in updates:
+            values = {column: '' if value is None else str(value) for column, value in values.items()
+                      if column in LISTING_COLUMNS and str(row.get(column, '')) != ('' if value is None else str(value))}
+            if not values:
+                continue
+            assignments = ', '.join(f"{quote(column)} = ?" for column in values)
+            connection.execute(
+                f"UPDATE listings SET {assignments}, updated_at = ? WHERE url_key = ? AND address = ?",
+                tuple(values.values()) + (time.time(), row['url_key'], row['address']),
+            )
+            changed += 1
+        connection.execute('COMMIT')
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
+    count_stat('enriched', changed)
+    return changed
+
+
+def export_columns(table, rows):
+    if table == 'errors':
+        return FIELDNAMES
+    # The link column only exists in the CSV once add_google_map_link has run
+    return FIELDNAMES + [column for column in ENRICHMENT_COLUMNS if any(row.get(column) for row in rows)]
+
+
+def export_csv(filepath, table='listings', run=None):
+    """Write a table in the layout of results.csv / errors-N.csv."""
+    rows = read_rows(table, run=run)
+    columns = export_columns(table, rows)
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    temp_path = f"{filepath}.tmp"
+    with open(temp_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, filepath)
+    logger.info(f"Exported {len(rows)} rows from {table} to {filepath}")
+    return len(rows)
+
+
+def export_parquet(filepath, table='listings', run=None):
+    """Write a table as Parquet; needs pandas with pyarrow or fastparquet installed."""
+    import pandas as pd
+
+    rows = read_rows(table, run=run)
+    columns = export_columns(table, rows)
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    try:
+        pd.DataFrame(rows, columns=columns).to_parquet(filepath, index=False)
+    except ImportError as e:
+        logger.error(f"Parquet export needs pyarrow or fastparquet: {e}")
+        return 0
+    logger.info(f"Exported {len(rows)} rows from {table} to {filepath}")
+    return len(rows)
+
+
+def get_db_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def log_db_report():
+    stats = get_db_stats()
+    if not any(stats.values()):
+        return
+    logger.info(
+        f"Result database {DB_PATH}: {stats['inserted']} listings inserted, {stats['updated']} updated, "
+        f"{stats['errors']} error rows, {stats['enriched']} rows enriched"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the result database")
+    parser.add_argument('--csv', help="Write listings to this CSV file, e.g. results/results.csv")
+    parser.add_argument('--parquet', help="Write listings to this Parquet file")
+    parser.add_argument('--errors', metavar='RUN', help="Export the error rows of RUN (e.g. errors-3) instead of listings")
+    args = parser.parse_args()
+
+    table = 'errors' if args.errors else 'listings'
+    if not args.csv and not args.parquet:
+        parser.error("nothing to export; pass --csv and/or --parquet")
+    if args.csv:
+        export_csv(args.csv, table, run=args.errors)
+    if args.parquet:
+        export_parquet(args.parquet, table, run=args.errors)
@@ -0,0 +1,167 @@
+import os
+import time
+import queue
+import threading
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+# Rows waiting to be written; producers block (rather than drop rows) when it is full
+QUEUE_SIZE = int(os.getenv('RESULT_QUEUE_SIZE', 10000))
+# A batch is written once it holds this many rows or its oldest row is this old
+BATCH_ROWS = int(os.getenv('RESULT_BATCH_ROWS', 500))
+BATCH_SECONDS = float(os.getenv('RESULT_BATCH_SECONDS', 1.0))
+
+_STOP = object()
+
+
+class ResultSink:
+    """Single writer thread for result files.
+
+    Worker threads enqueue (filepath, rows) and return immediately; the
+    writer groups queued rows per file and hands each group to ``write``
+    in one call, so concurrent saves never interleave and a file is
+    touched once per batch instead of once per save. close() drains the
+    queue and calls ``sync`` so nothing is lost on shutdown; rows that could
+    still not be written are kept in ``failed_rows`` for the caller to report.
+    """
+
+    def __init__(self, write, sync=None):
+        self.write = write
+        self.sync = sync
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.stats = {'saves': 0, 'rows': 0, 'batches': 0, 'failed_batches': 0, 'max_queue': 0}
+        self.stats_lock = threading.Lock()
+        self.closed = False
+        self.written_files = set()
+        self.failed_rows = {}
+        self.thread = threading.Thread(target=self._run, name='result-sink', daemon=True)
+        self.thread.start()
+
+    def put(self, filepath, rows):
+        if self.closed:
+            raise RuntimeError("Result sink is closed")
+        self.queue.put((filepath, list(rows)))
+        with self.stats_lock:
+            self.stats['saves'] += 1
+            self.stats['rows'] += len(rows)
+            self.stats['max_queue'] = max(self.stats['max_queue'], self.queue.qsize())
+
+    def _run(self):
+        pending = {}
+        pending_rows = 0
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                filepath, rows = item
+                pending.setdefault(filepath, []).extend(rows)
+                pending_rows += len(rows)
+                if deadline is None:
+                    deadline = time.monotonic() + BATCH_SECONDS
+
+            due = deadline is not None and time.monotonic() >= deadline
+            if pending and (stopping or due or pending_rows >= BATCH_ROWS):
+                pending = self._write(pending)
+                pending_rows = sum(len(rows) for rows in pending.values())
+                deadline = time.monotonic() + BATCH_SECONDS if pending else None
+
+        if pending:
+            pending = self._write(pending)
+        for filepath, rows in pending.items():
+            logger.error(f"Could not write {len(rows)} rows to {filepath}")
+        self.failed_rows = pending
+        if self.sync:
+            for filepath in self.written_files:
+                try:
+                    self.sync(filepath)
+                except OSError as e:
+                    logger.error(f"Failed to sync {filepath}: {e}")
+
+    def _write(self, pending):
+        """Write each file's rows; returns the ones that failed, to retry with the next batch."""
+        failed = {}
+        for filepath, rows in pending.items():
+            try:
+                self.write(filepath, rows)
+                self.written_files.add(filepath)
+                with self.stats_lock:
+                    self.stats['batches'] += 1
+            except Exception as e:
+                logger.error(f"Failed to write {len(rows)} rows to {filepath}, will retry: {e}")
+                failed[filepath] = rows
+                with self.stats_lock:
+                    self.stats['failed_batches'] += 1
+        return failed
+
+    def close(self):
+        """Stop accepting rows, write everything queued and sync the files.
+        Returns {filepath: rows} for the rows that could not be written."""
+        if self.closed:
+            return self.failed_rows
+        self.closed = True
+        self.queue.put(_STOP)
+        self.thread.join()
+        stats = self.stats
+        if stats['saves']:
+            logger.info(
+                f"Result sink: {stats['rows']} rows from {stats['saves']} saves written in {stats['batches']} batches "
+                f"(max queue {stats['max_queue']}, {stats['failed_batches']} failed writes)"
+            )
+        return self.failed_rows
+
+
+def stress_test(producers=32, saves_per_producer=200, rows_per_save=3):
+    """Drive many concurrent producers through save() and check every row lands."""
+    import csv
+    import tempfile
+    import save_data
+
+    with tempfile.TemporaryDirectory() as directory:
+        previous = os.getcwd()
+        os.chdir(directory)
+        try:
+            def produce(producer):
+                for n in range(saves_per_producer):
+                    rows = [
+                        {'URL_Scrapped': f"https://site{producer}.com/rooms", 'Website_Address': f"{n}-{i} Main St", 'Price': f"${n}"}
+                        for i in range(rows_per_save)
+                    ]
+                    save_data.save(rows, 'success')
+                    save_data.save([{'URL_Scrapped': f"https://site{producer}.com/{n}", 'Note': 'failed'}], 'error')
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=produce, args=(p,)) for p in range(producers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            enqueued = time.perf_counter() - start
+            save_data.finalize_results()
+            total = time.perf_counter() - start
+
+            with open(os.path.join('results', 'results.csv'), newline='', encoding='utf-8') as f:
+                results = sum(1 for _ in csv.DictReader(f))
+            with open(os.path.join('results', 'errors-1.csv'), newline='', encoding='utf-8') as f:
+                errors = sum(1 for _ in csv.DictReader(f))
+            expected_results = producers * saves_per_producer * rows_per_save
+            expected_errors = producers * saves_per_producer
+            print(f"{producers} producers, {2 * producers * saves_per_producer} saves: enqueued in {enqueued:.2f}s, "
+                  f"written in {total:.2f}s")
+            print(f"results.csv: {results}/{expected_results} rows, errors-1.csv: {errors}/{expected_errors} rows")
+            assert results == expected_results and errors == expected_errors, "rows were lost"
+        finally:
+            os.chdir(previous)
+
+
+if __name__ == "__main__":
+    stress_test()
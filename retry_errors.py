@@ -1,23 +1,37 @@
 import csv
 import os
 import json
+import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from logger_config import logger
-from scrapper import scrape_data
+from url_utils import normalize_url, get_site
+from fetcher import fetch_parsed_page
+from driver_pool import shutdown_driver_pool
+from link_ranker import log_ranker_report
+from rate_limiter import log_limiter_report
+from llm_cache import log_cache_report
+from chunk_filter import log_filter_report
+from provider_health import log_provider_report
+from request_batcher import log_batch_report
+from llm_metrics import run_with_context, write_metrics_report
 from main import (
     get_unique_urls,
     retrieve_room_link,
-    process_room_soup,
-    get_room_details
+    process_room_page,
+    get_room_details,
+    add_cache_arguments,
+    apply_cache_arguments
 )
 from process_data import process
-from save_data import save
+from save_data import save, finalize_results, USE_DB
 
 # Constants for retry configuration
-RETRY_WAIT_TIMES = {
-    'scraping_error': 15,
-    'url_error': 15,
-    'data_error': 10
+# Readiness profile per category: a name from page_readiness.READINESS_PROFILES
+# or a dict of overrides on top of the default profile
+RETRY_READINESS_PROFILES = {
+    'scraping_error': 'relaxed',
+    'url_error': 'default',
+    'data_error': 'relaxed'
 }
 
 MAX_RETRIES = {
@@ -26,9 +40,25 @@ MAX_RETRIES = {
     'data_error': 1
 }
 
+# Failures that depend on the page content are retried against a fresh fetch;
+# the others happened after a successful fetch and may reuse the cached page
+REFRESH_PAGE_CACHE = {
+    'scraping_error': True,
+    'url_error': True,
+    'data_error': False
+}
+
 DEFAULT_MAX_WORKERS = int(os.getenv('MAX_WORKERS', 5))
 
+# Ask the model again instead of reusing cached answers (--refresh-ai)
+REFRESH_AI = False
+
 def read_error_csv(error_csv_path):
+    if USE_DB and not os.path.exists(error_csv_path):
+        from result_db import read_rows, run_name
+        rows = read_rows('errors', run=run_name(error_csv_path))
+        return [(row['URL_Scrapped'], row.get('Note', '')) for row in rows if row['URL_Scrapped']]
+
     if not os.path.exists(error_csv_path):
         logger.error(f"Error CSV file not found: {error_csv_path}")
         return []
@@ -67,12 +97,12 @@ def categorize_error(note):
             return category
     return 'unknown_error'
 
-def get_room_iframe_src(soup, iframe=None):
+def get_room_iframe_src(page, iframe=None):
     if iframe:
-        iframe_tag = soup.find('iframe')
-        if iframe_tag and 'src' in iframe_tag.attrs:
-            logger.info(f"Found iframe with src: {iframe_tag['src']}")
-            return iframe_tag['src']
+        if page and page.iframe_srcs:
+            src = normalize_url(page.iframe_srcs[0], page.url)
+            logger.info(f"Found iframe with src: {src}")
+            return src
         else:
             logger.warning("No src attribute found in the iframe tag.")
     else:
@@ -86,25 +116,26 @@ def process_url(url_data):
     
     try:
         if error_category in ['scraping_error', 'url_error']:
-            wait_time = RETRY_WAIT_TIMES[error_category]
+            profile = RETRY_READINESS_PROFILES[error_category]
             retries = MAX_RETRIES[error_category]
+            refresh = REFRESH_PAGE_CACHE[error_category]
             
             for attempt in range(retries):
                 logger.info(f"Retry attempt {attempt + 1}/{retries} for {url}")
                 
-                soup = scrape_data(url, wait_time=wait_time)
-                if not soup:
+                page = fetch_parsed_page(url, profile=profile, refresh=refresh)
+                if not page:
                     note = "Initial page scraping failed"
                     logger.error(f"{note} for {url} - attempt {attempt + 1}")
                     continue
                 
-                unique_urls = get_unique_urls(soup, url)
+                unique_urls = get_unique_urls(page, url)
                 if not unique_urls:
                     note = "No unique URLs found"
                     logger.error(f"{note} for {url} - attempt {attempt + 1}")
                     continue
                 
-                link = retrieve_room_link(unique_urls)
+                link = retrieve_room_link(unique_urls, refresh=REFRESH_AI)
                 if not link:
                     note = "Room link retrieval failed"
                     logger.error(f"{note} for {url} - attempt {attempt + 1}")
@@ -112,14 +143,16 @@ def process_url(url_data):
                 
                 data_to_save['URL_Scrapped'] = link
                 
-                room_page_soup = scrape_data(link, wait_time=wait_time)
-                if not room_page_soup:
+                room_page = fetch_parsed_page(link, profile=profile, room_page=True, refresh=refresh)
+                if not room_page:
                     note = "Room page scraping failed"
                     logger.error(f"{note} for {url} - attempt {attempt + 1}")
                     continue
                 
-                room_page_text = process_room_soup(room_page_soup)
-                room_details = get_room_details(room_page_text)
+                room_page_text = process_room_page(room_page)
+                room_details = get_room_details(
+                    room_page_text, room_page.html, refresh=REFRESH_AI, site=get_site(room_page.url)
+                )
                 if not room_details:
                     note = "Room details retrieval failed"
                     logger.error(f"{note} for {url} - attempt {attempt + 1}")
@@ -156,27 +189,30 @@ def process_url(url_data):
                     continue
                 
         elif error_category == 'data_error':
-            wait_time = RETRY_WAIT_TIMES['data_error']
+            profile = RETRY_READINESS_PROFILES['data_error']
             retries = MAX_RETRIES['data_error']
+            refresh = REFRESH_PAGE_CACHE['data_error']
             
             for attempt in range(retries):
                 logger.info(f"Data retry attempt {attempt + 1}/{retries} for {url}")
                 
-                soup = scrape_data(url, wait_time)
-                iframe_src = get_room_iframe_src(soup, True)
+                page = fetch_parsed_page(url, profile, refresh=refresh)
+                iframe_src = get_room_iframe_src(page, True)
                 if not iframe_src:
                     note = "Room page scraping failed"
                     logger.error(f"{note} for {url} - attempt {attempt + 1}")
                     continue
                 
-                soup = scrape_data(iframe_src, wait_time)
-                if not soup:
+                room_page = fetch_parsed_page(iframe_src, profile, room_page=True, refresh=refresh)
+                if not room_page:
                     note = "Room page scraping failed"
                     logger.error(f"{note} for {url} - attempt {attempt + 1}")
                     continue
                 
-                room_page_text = process_room_soup(soup)
-                room_details = get_room_details(room_page_text)
+                room_page_text = process_room_page(room_page)
+                room_details = get_room_details(
+                    room_page_text, room_page.html, refresh=REFRESH_AI, site=get_site(room_page.url)
+                )
                 
                 if not room_details:
                     note = "Room details retrieval failed"
@@ -245,19 +281,33 @@ def retry_errors(error_csv_path, max_workers=DEFAULT_MAX_WORKERS):
     logger.info(f"Found {len(errored_websites)} errored websites to retry")
     
     results = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_url = {executor.submit(process_url, url_data): url_data for url_data in errored_websites}
-        for future in as_completed(future_to_url):
-            url_data = future_to_url[future]
-            try:
-                success = future.result()
-                results.append((url_data[0], url_data[1], success))
-                logger.info(f"Completed retry for {url_data[0]}")
-            except Exception as exc:
-                error_message = f"Retry for {url_data[0]} generated an exception: {exc}"
-                logger.error(error_message)
-                save([{'URL_Scrapped': url_data[0], 'Note': error_message}], 'error')
-                results.append((url_data[0], url_data[1], False))
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_url = {
+                executor.submit(run_with_context, process_url, url_data, site=get_site(url_data[0])): url_data
+                for url_data in errored_websites
+            }
+            for future in as_completed(future_to_url):
+                url_data = future_to_url[future]
+                try:
+                    success = future.result()
+                    results.append((url_data[0], url_data[1], success))
+                    logger.info(f"Completed retry for {url_data[0]}")
+                except Exception as exc:
+                    error_message = f"Retry for {url_data[0]} generated an exception: {exc}"
+                    logger.error(error_message)
+                    save([{'URL_Scrapped': url_data[0], 'Note': error_message}], 'error')
+                    results.append((url_data[0], url_data[1], False))
+    finally:
+        shutdown_driver_pool()
+        finalize_results()
+        log_ranker_report()
+        log_limiter_report()
+        log_cache_report()
+        log_filter_report()
+        log_provider_report()
+        log_batch_report()
+        write_metrics_report()
     
     return results
 
@@ -272,7 +322,11 @@ def main_retry(error_csv_path):
 
 def get_latest_error_file():
     error_files = []
-    for file in os.listdir('results'):
+    files = os.listdir('results') if os.path.isdir('results') else []
+    if USE_DB:
+        from result_db import error_runs
+        files += [f"{run}.csv" for run in error_runs()]
+    for file in files:
         if file.startswith('errors-') and file.endswith('.csv'):
             try:
                 number = int(file.replace('errors-', '').replace('.csv', ''))
@@ -288,6 +342,14 @@ def get_latest_error_file():
     return os.path.join('results', latest_file)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retry websites listed in an error CSV file")
+    parser.add_argument('error_csv_path', nargs='?', help="Defaults to the latest results/errors-N.csv")
+    add_cache_arguments(parser)
+    parser.add_argument('--refresh-ai', action='store_true', help="Ask the model again instead of reusing cached answers")
+    args = parser.parse_args()
+
+    apply_cache_arguments(args)
+    REFRESH_AI = args.refresh_ai
     # error_csv_path = 'results/errors_nc_all.csv'
-    error_csv_path = get_latest_error_file()
+    error_csv_path = args.error_csv_path or get_latest_error_file()
     main_retry(error_csv_path)
@@ -1,11 +1,30 @@
 import json
-import csv
 import os
-from datetime import datetime
+import atexit
+import threading
+from dotenv import load_dotenv
 from logger_config import logger
+from url_utils import canonical_key
+from csv_store import get_store, compact_stores
+from result_sink import ResultSink
+
+load_dotenv()
+
+# Comma-separated targets: 'local' writes the CSV files, 'sqlite' the result
+# database (RESULT_DB_PATH), 'google-sheet' the sheet GOOGLE_SHEET_ID; 'both' is local,google-sheet
+RESULT = os.getenv('RESULT', 'local').strip().lower()
+RESULT_TARGETS = {target.strip() for target in RESULT.replace('both', 'local,google-sheet').split(',') if target.strip()}
+USE_DB = 'sqlite' in RESULT_TARGETS
+USE_SHEETS = 'google-sheet' in RESULT_TARGETS
+USE_CSV = 'local' in RESULT_TARGETS or not (USE_DB or USE_SHEETS)
 
 # Add at the top of the file with other globals
 _current_error_filepath = None
+_filepath_lock = threading.Lock()
+_sink = None
+_sink_lock = threading.Lock()
+_sheets = None
+_sheets_lock = threading.Lock()
 
 def load_json_data(json_string):
     try:
@@ -29,68 +48,98 @@ def generate_filepath(type):
     
     if type == 'success':
         return os.path.join('results', 'results.csv')
-    else:
+    with _filepath_lock:
         if _current_error_filepath:
             return _current_error_filepath
             
         counter = 1
         while True:
             filepath = os.path.join('results', f'errors-{counter}.csv')
-            if not os.path.exists(filepath):
+            if not (os.path.exists(filepath) or (USE_DB and error_run_exists(filepath))
+                    or (USE_SHEETS and sheet_tab(filepath) in get_sheets().index)):
                 _current_error_filepath = filepath
                 return filepath
             counter += 1
 
-def write_csv(filepath, data, mode='a'):
-    try:
-        fieldnames = ['URL_Scrapped', 'Website_Address', 'Full_Address', 'Street_Number', 'Street_Name', 'Zipcode', 
-                      'State', 'City', 'County', 'Latitude', 'Longitude', 
-                      'Beds', 'Bath', 'Price', 'Available', 'Note', 'Timestamp']
-        
-        file_exists = os.path.isfile(filepath)
-        existing_data = []
-        
-        # Read existing data if file exists
-        if file_exists:
-            with open(filepath, 'r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                existing_data = list(reader)
-        
-        # Update existing data or add new entries
-        updated_data = []
-        current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        for new_row in data:
-            existing_row = next((row for row in existing_data if 
-                                 row['URL_Scrapped'] == new_row.get('URL_Scrapped') and
-                                 row['Website_Address'] == new_row.get('Website_Address')), None)
-            if existing_row:
-                existing_row.update(new_row)
-                existing_row['Timestamp'] = current_timestamp
-                existing_row['Note'] = 'Data updated successfully'
-                updated_data.append(existing_row)
-            else:
-                new_row['Timestamp'] = current_timestamp
-                updated_data.append(new_row)
-        
-        # Add remaining existing data that wasn't updated
-        for row in existing_data:
-            if row not in updated_data:
-                updated_data.append(row)
-        
-        # Write updated data to file
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for row in updated_data:
-                row_data = {field: row.get(field, '') for field in fieldnames}
-                writer.writerow(row_data)
-        
-        logger.info(f"Data successfully updated and saved to {filepath}")
-    except Exception as e:
-        logger.error(f"Failed to save data to CSV: {e}")
-        return
+def row_key(row):
+    return (canonical_key(row.get('URL_Scrapped') or ''), row.get('Website_Address') or '')
+
+FIELDNAMES = ['URL_Scrapped', 'Website_Address', 'Full_Address', 'Street_Number', 'Street_Name', 'Zipcode',
+              'State', 'City', 'County', 'Latitude', 'Longitude',
+              'Beds', 'Bath', 'Price', 'Available', 'Note', 'Timestamp']
+
+def error_run_exists(filepath):
+    from result_db import error_run_exists
+    return error_run_exists(filepath)
+
+def get_sheets():
+    """The Google Sheets writer, created on first use. Rows are written from the
+    result sink's thread; worker threads only read its tab index in generate_filepath."""
+    global _sheets
+    with _sheets_lock:
+        if _sheets is None:
+            from sheets_sink import SheetsSink, SHEET_ID
+            _sheets = SheetsSink(SHEET_ID, FIELDNAMES, row_key)
+        return _sheets
+
+def sheet_tab(filepath):
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+def write_rows(filepath, data):
+    if USE_DB:
+        from result_db import save_rows
+        written = save_rows(filepath, data)
+        logger.info(f"Data successfully saved to the result database for {filepath} ({written} rows)")
+    if USE_CSV:
+        # Rows are upserted by (URL_Scrapped, Website_Address) through an in-memory
+        # index and appended; superseded versions are compacted away later
+        written = get_store(filepath, FIELDNAMES, row_key).upsert(data)
+        logger.info(f"Data successfully updated and saved to {filepath} ({written} rows)")
+    if USE_SHEETS:
+        # Buffered and sent in batches; failed sends are kept and retried by the sheet writer
+        get_sheets().add(sheet_tab(filepath), data)
+
+def sync_rows(filepath):
+    if USE_SHEETS:
+        get_sheets().flush()
+    if USE_CSV:
+        # Database batches are committed in their own transactions
+        get_store(filepath, FIELDNAMES, row_key).sync()
+
+def get_sink():
+    """The writer thread all saves go through, started on first use."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = ResultSink(write_rows, sync_rows)
+        return _sink
+
+def close_sink():
+    """Stop the writer thread; returns {filepath: rows} it could not write."""
+    global _sink
+    with _sink_lock:
+        sink, _sink = _sink, None
+    if sink:
+        return sink.close()
+    return {}
+
+def report_failed_writes(failed_rows):
+    """Record an error row for each site whose results could not be written,
+    as the scraper does when a save fails; returns the number of lost rows."""
+    lost = sum(len(rows) for rows in failed_rows.values())
+    results_path = generate_filepath('success')
+    sites = {row.get('URL_Scrapped') for row in failed_rows.get(results_path, []) if row.get('URL_Scrapped')}
+    if sites:
+        try:
+            write_rows(generate_filepath('error'),
+                       [{'URL_Scrapped': url, 'Note': 'Processed data saving failed'} for url in sorted(sites)])
+        except Exception as e:
+            logger.error(f"Failed to record {len(sites)} sites whose results were not saved: {e}")
+    return lost
 
 def save(data, type='success', mode='a'):
+    """Queue rows for the writer thread. Returns False if they could not be queued;
+    rows that are queued but fail to write are reported by finalize_results()."""
     try:
         if not data:
             logger.warning("No data to save")
@@ -98,10 +147,31 @@ def save(data, type='success', mode='a'):
         
         create_results_folder()
         filepath = generate_filepath(type)
-        write_csv(filepath, data, mode)
+        # Queued for the writer thread; returns as soon as the rows are accepted
+        get_sink().put(filepath, [dict(row) for row in data])
         
-        logger.info("Data saving completed successfully")
+        logger.info("Data queued for saving")
         return True
     except Exception as e:
         logger.error(f"An error occurred during data saving: {e}")
         return False
+
+def finalize_results():
+    """Write out queued rows, sync and compact the result files at the end of a run.
+    Returns the number of rows that could not be written."""
+    global _sheets
+    lost = report_failed_writes(close_sink())
+    if lost:
+        logger.error(f"{lost} result rows could not be written; sites whose listings were lost are in the error file")
+    if USE_DB:
+        from result_db import log_db_report
+        log_db_report()
+    if USE_CSV:
+        compact_stores()
+    with _sheets_lock:
+        sheets, _sheets = _sheets, None
+    if sheets is not None:
+        sheets.close()
+    return lost
+
+atexit.register(close_sink)
@@ -0,0 +1,140 @@
+import json
+
+# Schemas use a small JSON Schema subset: type (a name or a list of names),
+# properties, required, items and enum. to_gemini_schema() maps them onto the
+# OpenAPI subset Gemini accepts for response_schema.
+
+STATUS_SCHEMA = {"type": "integer", "enum": [1, 0, -1]}
+
+# availability is optional in the extraction prompt, as in structured_data.REQUIRED_FIELDS
+ROOM_RECORD_SCHEMA = {
+    "type": "object",
+    "required": ["address", "price", "beds", "baths"],
+    "properties": {
+        "address": {"type": ["string", "null"]},
+        "price": {"type": ["string", "number", "null"]},
+        "availability": {"type": ["string", "null"]},
+        "beds": {"type": ["string", "number", "null"]},
+        "baths": {"type": ["string", "number", "null"]},
+    },
+}
+
+ROOM_DATA_SCHEMA = {
+    "type": "object",
+    "required": ["status", "message", "data"],
+    "properties": {
+        "status": STATUS_SCHEMA,
+        "message": {"type": "string"},
+        "data": {"type": ["array", "null"], "items": ROOM_RECORD_SCHEMA},
+    },
+}
+
+ROOM_LINK_SCHEMA = {
+    "type": "object",
+    "required": ["status", "message", "url"],
+    "properties": {
+        "status": STATUS_SCHEMA,
+        "message": {"type": "string"},
+        "url": {"type": ["string", "null"]},
+    },
+}
+
+TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+
+def validate(value, schema, path="$"):
+    """Return a list of human-readable violations of ``schema`` in ``value``."""
+    types = schema.get("type")
+    if types:
+        types = types if isinstance(types, list) else [types]
+        if not any(TYPE_CHECKS[name](value) for name in types):
+            return [f"{path} should be {' or '.join(types)}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} should be one of {schema['enum']}, got {value!r}"]
+
+    errors = []
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}.{name} is missing")
+        for name, property_schema in schema.get("properties", {}).items():
+            if name in value:
+                errors.extend(validate(value[name], property_schema, f"{path}.{name}"))
+    elif isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+def parse_json(text):
+    """Parse a reply that should be JSON, tolerating code fences or prose around one object."""
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("reply contains no JSON object")
+    return json.loads(text[start:end + 1])
+
+
+def parse_and_validate(text, schema):
+    """Return (value, errors); errors is empty when the reply matches ``schema``."""
+    try:
+        value = parse_json(text)
+    except ValueError as e:
+        return None, [f"reply is not valid JSON: {e}"]
+    return value, validate(value, schema)
+
+
+def has_success_status(reply):
+    """True when a reply (text or parsed) carries status 1; 0 and -1 mean the model
+    found nothing or gave up, which should be neither cached nor accepted."""
+    if not isinstance(reply, dict):
+        try:
+            reply = parse_json(reply)
+        except ValueError:
+            return False
+    return isinstance(reply, dict) and reply.get("status") == 1
+
+
+def to_gemini_schema(schema):
+    """Gemini takes one type per field plus ``nullable``; unions of scalars become strings."""
+    converted = {}
+    types = schema.get("type", [])
+    types = types if isinstance(types, list) else [types]
+    concrete = [name for name in types if name != "null"]
+    if concrete:
+        converted["type"] = concrete[0] if len(concrete) == 1 else "string"
+    if "null" in types:
+        converted["nullable"] = True
+    if "enum" in schema and converted.get("type") == "string":
+        converted["enum"] = schema["enum"]
+    if "properties" in schema:
+        converted["properties"] = {name: to_gemini_schema(value) for name, value in schema["properties"].items()}
+        converted["required"] = list(schema.get("required", []))
+    if "items" in schema:
+        converted["items"] = to_gemini_schema(schema["items"])
+    return converted
+
+
+def batch_schema(item_schema):
+    """Schema for one reply covering several segments, each answered as ``item_schema``
+    plus the ``segment`` ID it came from."""
+    item = dict(item_schema)
+    item["required"] = ["segment"] + list(item_schema.get("required", []))
+    item["properties"] = {"segment": {"type": "string"}, **item_schema.get("properties", {})}
+    return {
+        "type": "object",
+        "required": ["results"],
+        "properties": {"results": {"type": "array", "items": item}},
+    }
@@ -4,11 +4,6 @@ from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.prompt import Confirm
 
-from main import process_websites
-from process_address import process_data
-from add_google_map_link import main as add_google_maps
-from retry_errors import main_retry, get_latest_error_file
-
 console = Console()
 
 def display_banner():
@@ -54,15 +49,17 @@ def main_pipeline():
     # Execute based on user choices
     if choices["scrape"]:
         console.print("\n[yellow]Step 1: Website Scraping[/yellow]")
+        from main import process_websites
         csv_path = 'data/websites.csv'
         run_with_spinner("Running main scraping process", process_websites, csv_path)
         console.print("[green]✓[/green] Main scraping completed\n")
     
     if choices["process_addresses"]:
         console.print("\n[yellow]Step 2: Address Processing[/yellow]")
+        from process_address import process_addresses
         run_with_spinner(
             "Processing addresses",
-            process_data,
+            process_addresses,
             "results/results.csv",
             max_rows
         )
@@ -70,6 +67,7 @@ def main_pipeline():
     
     if choices["add_maps"]:
         console.print("\n[yellow]Step 3: Google Maps Links[/yellow]")
+        from add_google_map_link import add_links as add_google_maps
         run_with_spinner(
             "Adding Google Maps links",
             add_google_maps,
@@ -79,6 +77,7 @@ def main_pipeline():
     
     if choices["retry_errors"]:
         console.print("\n[yellow]Step 4: Error Retry[/yellow]")
+        from retry_errors import main_retry, get_latest_error_file
         run_with_spinner(
             "Retrying failed operations",
             main_retry,
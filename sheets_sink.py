@@ -0,0 +1,430 @@
+import os
+import re
+import json
+import time
+import threading
+from datetime import datetime
+from urllib.parse import quote
+import requests
+from dotenv import load_dotenv
+from logger_config import logger
+from rate_limiter import acquire, backoff_delay, report_rate_limited
+
+load_dotenv()
+
+SHEET_ID = os.getenv('GOOGLE_SHEET_ID', '')
+# Service account JSON key; leave empty to call the endpoint without auth (e.g. a local fake)
+SHEET_CREDENTIALS = os.getenv('GOOGLE_SHEET_CREDENTIALS', '')
+SHEETS_ENDPOINT = os.getenv('GOOGLE_SHEETS_ENDPOINT', 'https://sheets.googleapis.com').rstrip('/')
+# Rows per values.append / values.batchUpdate request
+SHEET_BATCH_ROWS = int(os.getenv('GOOGLE_SHEET_BATCH_ROWS', 500))
+# Rows are held back for up to this long so each request carries as many as possible
+SHEET_FLUSH_SECONDS = float(os.getenv('GOOGLE_SHEET_FLUSH_SECONDS', 10))
+SHEET_MAX_RETRIES = int(os.getenv('GOOGLE_SHEET_MAX_RETRIES', 5))
+# Row numbers of the keys already in the sheet, so updates never read the sheet back
+SHEET_KEY_INDEX = os.getenv('GOOGLE_SHEET_KEY_INDEX', os.path.join('cache', 'sheet_keys.json'))
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Replies that mean the request was not applied, so even an append can be sent again
+NOT_APPLIED_STATUSES = {429, 503}
+
+
+class SheetsError(Exception):
+    pass
+
+
+class UncertainWrite(SheetsError):
+    """A non-idempotent request failed in a way that leaves open whether it was applied."""
+
+
+def column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def tab_range(tab, start, end=None):
+    name = "'" + tab.replace("'", "''") + "'"
+    return f"{name}!{start}" + (f":{end}" if end else '')
+
+
+def first_row(updated_range):
+    match = re.search(r'![A-Z]+(\d+)', updated_range or '')
+    if not match:
+        raise SheetsError(f"Unexpected range in append reply: {updated_range!r}")
+    return int(match.group(1))
+
+
+class SheetsSink:
+    """Writes result rows to a Google Sheet in batches.
+
+    Rows for each tab are buffered and sent as one values.append for new keys
+    and one values.batchUpdate for keys already in the sheet, at most
+    SHEET_BATCH_ROWS rows per request. Where each key lives is kept in a local
+    index (SHEET_KEY_INDEX), so updates never read the sheet back; updates
+    only write the cells the new row carries. Requests go through the 'sheets'
+    rate limiter and are retried with backoff; rows that still fail stay
+    buffered for the next flush. An append is only resent when the failure
+    shows it never arrived; after an ambiguous one (timeout, 5xx) the tab's
+    keys are re-read from the sheet first, so no row is written twice.
+    """
+
+    def __init__(self, sheet_id, fieldnames, key, endpoint=SHEETS_ENDPOINT, index_path=SHEET_KEY_INDEX):
+        self.sheet_id = sheet_id
+        self.fieldnames = list(fieldnames)
+        self.key = key
+        self.endpoint = endpoint
+        self.index_path = index_path
+        self.session = self.create_session()
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.oldest = None
+        self.index = self.load_index()
+        # Tabs whose last append may or may not have landed; re-read before writing to them again
+        self.unreconciled = set()
+        self.stats = {'rows': 0, 'appended': 0, 'updated': 0, 'requests': 0, 'retries': 0, 'failed_flushes': 0}
+
+    def create_session(self):
+        if not SHEET_CREDENTIALS:
+            return requests.Session()
+        from google.oauth2 import service_account
+        from google.auth.transport.requests import AuthorizedSession
+        credentials = service_account.Credentials.from_service_account_file(SHEET_CREDENTIALS, scopes=SCOPES)
+        return AuthorizedSession(credentials)
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    return json.load(f).get(self.sheet_id, {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read sheet key index {self.index_path}: {e}")
+        return {}
+
+    def save_index(self):
+        indexes = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    indexes = json.load(f)
+            except (OSError, ValueError):
+                indexes = {}
+        indexes[self.sheet_id] = self.index
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(indexes, f)
+        os.replace(temp_path, self.index_path)
+
+    def request(self, path, body=None, params=None, idempotent=True, method='POST'):
+        """Send one API request, retrying transient failures with backoff. Requests that
+        are not idempotent (appends) are only retried when the failure shows they were
+        never applied; otherwise UncertainWrite is raised."""
+        url = f"{self.endpoint}/v4/spreadsheets/{self.sheet_id}{path}"
+        for attempt in range(SHEET_MAX_RETRIES + 1):
+            acquire('sheets', None, 0)
+            error = None
+            try:
+                response = self.session.request(method, url, json=body, params=params, timeout=60)
+                self.stats['requests'] += 1
+                if response.status_code < 300:
+                    return response.json()
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRY_STATUSES:
+                    raise SheetsError(error)
+                if not idempotent and response.status_code not in NOT_APPLIED_STATUSES:
+                    raise UncertainWrite(error)
+                retry_after = response.headers.get('Retry-After')
+            except requests.RequestException as e:
+                error = str(e)
+                # A failed connect never reached the server; a read timeout may have been applied
+                if not idempotent and not isinstance(e, requests.ConnectionError):
+                    raise UncertainWrite(error)
+                retry_after = None
+            if attempt == SHEET_MAX_RETRIES:
+                raise SheetsError(error)
+            delay = backoff_delay(attempt, retry_after)
+            self.stats['retries'] += 1
+            if retry_after or '429' in error:
+                report_rate_limited('sheets', None, delay)
+            else:
+                logger.warning(f"Sheets request failed ({error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def ensure_tab(self, tab):
+        """Create the tab with a header row the first time rows are written to it."""
+        if tab in self.index:
+            return self.index[tab]
+        try:
+            self.request(':batchUpdate', {'requests': [{'addSheet': {'properties': {'title': tab}}}]})
+        except SheetsError as e:
+            if 'already exists' not in str(e):
+                raise
+        self.append(tab, [self.fieldnames])
+        self.index[tab] = {'keys': {}}
+        return self.index[tab]
+
+    def append(self, tab, values):
+        """Append rows after the tab's data; returns the sheet row number of the first one."""
+        try:
+            reply = self.request(
+                f"/values/{quote(tab_range(tab, 'A1'), safe='')}:append",
+                {'values': values},
+                params={'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS'},
+                idempotent=False,
+            )
+        except UncertainWrite:
+            # The rows may have landed; the next flush re-reads the tab's keys so they
+            # are updated in place instead of appended twice
+            self.unreconciled.add(tab)
+            raise
+        return first_row(reply.get('updates', {}).get('updatedRange'))
+
+    def reconcile(self, tab):
+        """Rebuild the key index of ``tab`` from the sheet after an uncertain append."""
+        last_column = column_letter(len(self.fieldnames) - 1)
+        reply = self.request(
+            f"/values/{quote(tab_range(tab, 'A1', last_column), safe='')}", method='GET'
+        )
+        values = reply.get('values', [])
+        if not values:
+            # Not even the header landed; ensure_tab starts the tab again
+            self.index.pop(tab, None)
+        else:
+            header = values[0]
+            keys = {}
+            for row_number, cells in enumerate(values[1:], start=2):
+                keys['\x1f'.join(self.key(dict(zip(header, cells))))] = row_number
+            self.index[tab] = {'keys': keys}
+            logger.info(f"Re-read {len(keys)} keys of sheet tab {tab} after an uncertain append")
+        self.unreconciled.discard(tab)
+        self.save_index()
+
+    def add(self, tab, rows):
+        """Buffer rows for ``tab``; sends them once the buffer is full or old enough."""
+        with self.lock:
+            self.pending.setdefault(tab, []).extend(rows)
+            self.stats['rows'] += len(rows)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            buffered = sum(len(rows) for rows in self.pending.values())
+            if buffered >= SHEET_BATCH_ROWS or time.monotonic() - self.oldest >= SHEET_FLUSH_SECONDS:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        failed = {}
+        for tab, rows in self.pending.items():
+            try:
+                self.write_tab(tab, rows)
+            except (SheetsError, OSError) as e:
+                logger.error(f"Failed to write {len(rows)} rows to sheet tab {tab}, will retry: {e}")
+                failed[tab] = rows
+                self.stats['failed_flushes'] += 1
+        self.pending = failed
+        self.oldest = time.monotonic() if failed else None
+
+    def write_tab(self, tab, rows):
+        if tab in self.unreconciled:
+            self.reconcile(tab)
+        tab_index = self.ensure_tab(tab)
+        keys = tab_index['keys']
+        current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        new_rows = {}
+        updates = {}
+        for row in rows:
+            key = '\x1f'.join(self.key(row))
+            row = {**row, 'Timestamp': current_timestamp}
+            if key in keys or key in new_rows:
+                row['Note'] = 'Data updated successfully'
+            if key in new_rows:
+                new_rows[key] = {**new_rows[key], **row}
+            elif key in keys:
+                updates[key] = {**updates.get(key, {}), **row}
+            else:
+                new_rows[key] = row
+
+        for start in range(0, len(updates), SHEET_BATCH_ROWS):
+            batch = list(updates.items())[start:start + SHEET_BATCH_ROWS]
+            data = [item for key, row in batch for item in self.cell_ranges(tab, keys[key], row)]
+            self.request('/values:batchUpdate', {'valueInputOption': 'RAW', 'data': data})
+            self.stats['updated'] += len(batch)
+
+        for start in range(0, len(new_rows), SHEET_BATCH_ROWS):
+            batch = list(new_rows.items())[start:start + SHEET_BATCH_ROWS]
+            values = [[self.cell(row.get(field)) for field in self.fieldnames] for _, row in batch]
+            row_number = self.append(tab, values)
+            for offset, (key, _) in enumerate(batch):
+                keys[key] = row_number + offset
+            self.stats['appended'] += len(batch)
+            self.save_index()
+        if updates and not new_rows:
+            self.save_index()
+
+    def cell(self, value):
+        return '' if value is None else value
+
+    def cell_ranges(self, tab, row_number, row):
+        """One range per run of adjacent columns the row carries, so other cells keep their values."""
+        ranges = []
+        run = []
+        for position, field in enumerate(self.fieldnames + [None]):
+            if field is not None and field in row:
+                run.append(position)
+                continue
+            if run:
+                start, end = column_letter(run[0]), column_letter(run[-1])
+                ranges.append({
+                    'range': tab_range(tab, f"{start}{row_number}", f"{end}{row_number}"),
+                    'values': [[self.cell(row[self.fieldnames[i]]) for i in run]],
+                })
+                run = []
+        return ranges
+
+    def close(self):
+        self.flush()
+        lost = sum(len(rows) for rows in self.pending.values())
+        if lost:
+            logger.error(f"Could not write {lost} rows to Google Sheet {self.sheet_id}")
+        stats = self.stats
+        if stats['rows']:
+            logger.info(
+                f"Google Sheet: {stats['appended']} rows appended, {stats['updated']} updated "
+                f"in {stats['requests']} requests ({stats['retries']} retries)"
+            )
+
+
+class FakeSheetsServer:
+    """Minimal in-memory stand-in for the Sheets endpoints the sink uses."""
+
+    def __init__(self, fail_every=0, lose_append_reply_every=0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.tabs = {}
+        self.requests = 0
+        self.appends = 0
+        self.fail_every = fail_every
+        # Apply every Nth append but answer with a 500, as if the reply was lost
+        self.lose_append_reply_every = lose_append_reply_every
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                from urllib.parse import unquote, urlparse
+                path = unquote(urlparse(self.path).path)
+                server.requests += 1
+                tab = server.parse_range(path.split('/values/')[1])[0]
+                if tab not in server.tabs:
+                    return self.reply(400, {'error': f"Unable to parse range: {tab}"})
+                values = [list(row) for row in server.tabs[tab]]
+                self.reply(200, {'values': values} if values else {})
+
+            def do_POST(self):
+                from urllib.parse import unquote, urlparse
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'{}')
+                path = unquote(urlparse(self.path).path)
+                server.requests += 1
+                if server.fail_every and server.requests % server.fail_every == 0:
+                    return self.reply(503, {'error': 'try again'})
+                if path.endswith(':batchUpdate') and '/values' not in path:
+                    for request in body['requests']:
+                        title = request['addSheet']['properties']['title']
+                        if title in server.tabs:
+                            return self.reply(400, {'error': f"A sheet with the name {title} already exists"})
+                        server.tabs[title] = []
+                    return self.reply(200, {})
+                if path.endswith(':append'):
+                    tab = server.parse_range(path.split('/values/')[1][:-len(':append')])[0]
+                    rows = server.tabs.setdefault(tab, [])
+                    start = len(rows) + 1
+                    rows.extend(list(values) for values in body['values'])
+                    server.appends += 1
+                    if server.lose_append_reply_every and server.appends % server.lose_append_reply_every == 0:
+                        return self.reply(500, {'error': 'internal error'})
+                    return self.reply(200, {'updates': {'updatedRange': f"'{tab}'!A{start}:A{len(rows)}"}})
+                if path.endswith('/values:batchUpdate'):
+                    for item in body['data']:
+                        tab, column, row_number = server.parse_range(item['range'])
+                        row = server.tabs[tab][row_number - 1]
+                        for offset, value in enumerate(item['values'][0]):
+                            row[column + offset] = value
+                    return self.reply(200, {})
+                self.reply(404, {'error': path})
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def parse_range(text):
+        tab, cells = text.rsplit('!', 1)
+        tab = tab.strip("'").replace("''", "'")
+        start = cells.split(':')[0]
+        letters = ''.join(c for c in start if c.isalpha())
+        column = 0
+        for letter in letters:
+            column = column * 26 + ord(letter) - 64
+        return tab, column - 1, int(start[len(letters):])
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+def self_test(rows=2000):
+    """Push inserts and updates through the sink against the fake server and check the sheet."""
+    import tempfile
+    from save_data import FIELDNAMES, row_key
+
+    server = FakeSheetsServer(fail_every=7, lose_append_reply_every=3)
+    with tempfile.TemporaryDirectory() as directory:
+        sink = SheetsSink('test-sheet', FIELDNAMES, row_key, endpoint=server.url,
+                          index_path=os.path.join(directory, 'keys.json'))
+        start = time.perf_counter()
+        for n in range(0, rows, 50):
+            sink.add('results', [{'URL_Scrapped': f"https://site{i}.com", 'Website_Address': f"{i} Main St",
+                                  'Price': f"${i}"} for i in range(n, n + 50)])
+        sink.add('results', [{'URL_Scrapped': f"https://site{i}.com", 'Website_Address': f"{i} Main St", 'Beds': '2'}
+                             for i in range(0, rows, 2)])
+        sink.close()
+        elapsed = time.perf_counter() - start
+
+        # A second sink reuses the key index instead of reading the sheet
+        again = SheetsSink('test-sheet', FIELDNAMES, row_key, endpoint=server.url,
+                           index_path=os.path.join(directory, 'keys.json'))
+        again.add('results', [{'URL_Scrapped': 'https://site1.com', 'Website_Address': '1 Main St', 'Price': '$99'}])
+        again.close()
+
+    sheet = server.tabs['results']
+    server.shutdown()
+    header, data = sheet[0], sheet[1:]
+    column = {name: header.index(name) for name in header}
+    assert len(data) == rows, f"expected {rows} rows, sheet has {len(data)}"
+    assert all(row[column['Price']] == f"${i}" for i, row in enumerate(data) if i != 1)
+    assert data[1][column['Price']] == '$99'
+    assert all(row[column['Beds']] == ('2' if i % 2 == 0 else '') for i, row in enumerate(data))
+    print(f"{rows} rows plus {rows // 2} updates in {sink.stats['requests']} requests "
+          f"({sink.stats['retries']} retries after injected failures, {server.appends // 3} lost append replies "
+          f"without duplicates), {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    self_test()
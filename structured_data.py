@@ -0,0 +1,279 @@
+import re
+import json
+from collections import deque
+from lxml import etree, html as lxml_html
+from logger_config import logger
+
+LISTING_TYPES = {
+    'Accommodation', 'HotelRoom', 'Room', 'Suite', 'Apartment', 'House', 'SingleFamilyResidence',
+    'Residence', 'Product', 'Offer', 'AggregateOffer', 'VacationRental',
+}
+# Types that are lodging by themselves; a bare Product or Offer could be anything
+LODGING_TYPES = LISTING_TYPES - {'Product', 'Offer', 'AggregateOffer'}
+PLACE_TYPES = {'LodgingBusiness', 'Hotel', 'Motel', 'Hostel', 'Resort', 'BedAndBreakfast', 'ApartmentComplex', 'Place'}
+
+# Fields an extracted record must carry to skip the LLM; availability is optional,
+# as it is in the LLM prompt
+REQUIRED_FIELDS = ('address', 'price', 'beds', 'baths')
+
+AVAILABILITY_LABELS = {
+    'InStock': 'Available',
+    'InStoreOnly': 'Available',
+    'OnlineOnly': 'Available',
+    'LimitedAvailability': 'Limited availability',
+    'PreOrder': 'Pre-order',
+    'PreSale': 'Pre-sale',
+    'BackOrder': 'Waitlist',
+    'OutOfStock': 'Unavailable',
+    'SoldOut': 'Unavailable',
+    'Discontinued': 'Unavailable',
+}
+
+CURRENCY_SYMBOLS = {'USD': '$', 'EUR': '€', 'GBP': '£', 'CAD': 'CA$', 'AUD': 'A$', 'INR': '₹', 'JPY': '¥'}
+
+SCHEMA_PREFIX_PATTERN = re.compile(r'^(https?://schema\.org/|schema:)', re.IGNORECASE)
+
+
+class JsonLdTarget:
+    """lxml parser target collecting the bodies of JSON-LD script blocks."""
+
+    def __init__(self):
+        self.blocks = []
+        self._current = None
+
+    def start(self, tag, attrib):
+        if tag == 'script' and attrib.get('type', '').strip().lower() == 'application/ld+json':
+            self._current = []
+
+    def end(self, tag):
+        if tag == 'script' and self._current is not None:
+            self.blocks.append(''.join(self._current))
+            self._current = None
+
+    def data(self, data):
+        if self._current is not None:
+            self._current.append(data)
+
+    def close(self):
+        return self.blocks
+
+
+def strip_schema_prefix(value):
+    return SCHEMA_PREFIX_PATTERN.sub('', value.strip()) if isinstance(value, str) else value
+
+
+def get_types(obj):
+    types = obj.get('@type', [])
+    if not isinstance(types, list):
+        types = [types]
+    return {strip_schema_prefix(t) for t in types if isinstance(t, str)}
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def walk(obj):
+    """Yield every schema object nested anywhere in a parsed JSON-LD value."""
+    if isinstance(obj, list):
+        for item in obj:
+            yield from walk(item)
+    elif isinstance(obj, dict):
+        if '@type' in obj:
+            yield obj
+        for key, value in obj.items():
+            if key != '@type':
+                yield from walk(value)
+
+
+def parse_json_ld(page_html):
+    parser = etree.HTMLParser(target=JsonLdTarget(), recover=True, no_network=True)
+    parser.feed(page_html)
+    objects = []
+    for block in parser.close():
+        try:
+            objects.append(json.loads(block, strict=False))
+        except ValueError as e:
+            logger.debug(f"Skipping unparsable JSON-LD block: {e}")
+    return objects
+
+
+def element_value(element):
+    for attribute in ('content', 'datetime', 'value'):
+        if element.get(attribute):
+            return element.get(attribute).strip()
+    if element.tag in ('a', 'link', 'area') and element.get('href'):
+        return element.get('href').strip()
+    if element.tag in ('img', 'audio', 'video', 'source', 'iframe', 'embed') and element.get('src'):
+        return element.get('src').strip()
+    if element.tag == 'meta':
+        return element.get('content', '').strip()
+    return ' '.join(element.text_content().split())
+
+
+def build_item(element, type_attribute, property_attribute):
+    """Collect the properties of one microdata/RDFa item into a JSON-LD-like dict."""
+    item = {'@type': [strip_schema_prefix(t) for t in element.get(type_attribute, '').split()]}
+    stack = deque(element)
+    while stack:
+        child = stack.popleft()
+        names = child.get(property_attribute)
+        nested = child.get(type_attribute) is not None or (type_attribute == 'itemtype' and child.get('itemscope') is not None)
+        if names:
+            value = build_item(child, type_attribute, property_attribute) if nested else element_value(child)
+            for name in names.split():
+                name = strip_schema_prefix(name)
+                if name in item:
+                    item[name] = as_list(item[name]) + [value]
+                else:
+                    item[name] = value
+        if not nested:
+            stack.extendleft(reversed(child))
+    return item
+
+
+def parse_microdata_and_rdfa(page_html):
+    if 'itemscope' not in page_html and 'typeof' not in page_html:
+        return []
+    try:
+        tree = lxml_html.fromstring(page_html)
+    except (etree.ParserError, ValueError) as e:
+        logger.debug(f"Skipping microdata/RDFa parsing: {e}")
+        return []
+
+    objects = []
+    # Top-level items only; nested ones are folded into their parents by build_item
+    for element in tree.xpath('//*[@itemscope and @itemtype and not(@itemprop)]'):
+        objects.append(build_item(element, 'itemtype', 'itemprop'))
+    for element in tree.xpath('//*[@typeof and not(@property)]'):
+        objects.append(build_item(element, 'typeof', 'property'))
+    return objects
+
+
+def format_address(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if not isinstance(value, dict):
+        return ''
+    parts = [value.get('streetAddress'), value.get('addressLocality'), value.get('addressRegion'), value.get('postalCode')]
+    country = value.get('addressCountry')
+    if isinstance(country, dict):
+        country = country.get('name')
+    parts.append(country)
+    return ', '.join(' '.join(str(part).split()) for part in parts if part)
+
+
+def format_price(offer):
+    if not isinstance(offer, dict):
+        return ''
+    price = offer.get('price') or offer.get('lowPrice')
+    currency = offer.get('priceCurrency', '')
+    specification = offer.get('priceSpecification')
+    if not price and specification:
+        specification = as_list(specification)[0]
+        if isinstance(specification, dict):
+            price = specification.get('price') or specification.get('minPrice')
+            currency = currency or specification.get('priceCurrency', '')
+    if price in (None, ''):
+        return ''
+    currency = str(currency).upper()
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    return f"{symbol}{price}" if symbol else f"{price} {currency}".strip()
+
+
+def format_availability(offer):
+    if not isinstance(offer, dict) or not offer.get('availability'):
+        return ''
+    value = strip_schema_prefix(str(offer['availability']))
+    return AVAILABILITY_LABELS.get(value, value)
+
+
+def quantity(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get('value', value.get('numberOfBeds'))
+    if value in (None, ''):
+        return ''
+    return str(value).strip()
+
+
+def build_record(item, offer, fallback_address):
+    item = item or {}
+    offer = offer or {}
+    seller = offer.get('availableAtOrFrom') or offer.get('offeredBy')
+    seller_address = seller.get('address') if isinstance(seller, dict) else None
+    beds = quantity(item.get('numberOfBedrooms')) or quantity(item.get('numberOfRooms')) or quantity(item.get('bed'))
+    baths = quantity(item.get('numberOfBathroomsTotal')) or quantity(item.get('numberOfFullBathrooms'))
+    return {
+        'address': format_address(item.get('address')) or format_address(seller_address) or fallback_address,
+        'price': format_price(offer),
+        'availability': format_availability(offer),
+        'beds': beds,
+        'baths': baths,
+    }
+
+
+def records_from_objects(objects):
+    schema_objects = [obj for root in objects for obj in walk(root)]
+
+    place_addresses = {format_address(obj.get('address')) for obj in schema_objects if get_types(obj) & PLACE_TYPES}
+    place_addresses.discard('')
+    # A page-level address only applies when the page describes a single property
+    fallback_address = next(iter(place_addresses)) if len(place_addresses) == 1 else ''
+
+    records = []
+    consumed = set()
+    for obj in schema_objects:
+        types = get_types(obj)
+        if id(obj) in consumed or not types & LISTING_TYPES:
+            continue
+        consumed.add(id(obj))
+
+        if types & {'Offer', 'AggregateOffer'}:
+            offer = obj
+            item = next((i for i in as_list(obj.get('itemOffered')) if isinstance(i, dict)), None)
+        else:
+            item = obj
+            offer = next((o for o in as_list(obj.get('offers')) if isinstance(o, dict)), None)
+        for related in (item, offer):
+            if isinstance(related, dict):
+                consumed.add(id(related))
+
+        record = build_record(item, offer, fallback_address)
+        is_lodging = (types | get_types(item or {})) & LODGING_TYPES
+        # A gift card or parking Product has a price but no rooms; it must not become a listing
+        if (is_lodging and (record['price'] or record['beds'] or record['baths'])) or \
+                (record['price'] and (record['beds'] or record['baths'])):
+            records.append(record)
+
+    unique_records = []
+    for record in records:
+        if record not in unique_records:
+            unique_records.append(record)
+    return unique_records
+
+
+def extract_structured_records(page_html):
+    """Read schema.org listings embedded as JSON-LD, microdata or RDFa into
+    the same address/price/availability/beds/baths records the LLM returns."""
+    if not page_html:
+        return []
+    try:
+        objects = parse_json_ld(page_html) + parse_microdata_and_rdfa(page_html)
+        records = records_from_objects(objects)
+        if records:
+            complete = sum(1 for record in records if is_complete_record(record))
+            logger.info(f"Structured data yielded {len(records)} records ({complete} complete)")
+        return records
+    except Exception as e:
+        logger.error(f"Error extracting structured data: {e}")
+        return []
+
+
+def is_complete_record(record):
+    return all(record.get(field) for field in REQUIRED_FIELDS)
@@ -0,0 +1,220 @@
+import os
+import re
+import hashlib
+import threading
+from dotenv import load_dotenv
+from logger_config import logger
+
+load_dotenv()
+
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', int(int(os.getenv('MAX_WORDS', 1000)) * 1.3)))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', 100))
+# 'auto' uses tiktoken when it is installed and a word-based estimate otherwise
+CHUNK_TOKENIZER = os.getenv('CHUNK_TOKENIZER', 'auto').lower()
+DEDUPE_ENABLED = os.getenv('CHUNK_DEDUPE', 'true').lower() == 'true'
+DEDUPE_THRESHOLD = float(os.getenv('CHUNK_DEDUPE_THRESHOLD', 0.85))
+
+SHINGLE_SIZE = 4
+# Shorter blocks are only dropped as exact repeats; their shingles are too few to compare
+MIN_SHINGLE_WORDS = 8
+# Blocks with numbers or prices are never dropped: listing cards repeat lines like
+# "2 beds 1 bath" and often differ from each other only in those
+LISTING_SIGNAL_PATTERN = re.compile(r'\d|[$€£¥₹]')
+NUM_PERMUTATIONS = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+MAX_FINGERPRINTS_PER_SITE = 20000
+
+MERSENNE_PRIME = (1 << 61) - 1
+# Fixed coefficients so signatures are comparable across runs
+PERMUTATIONS = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], 'big') % MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], 'big') % MERSENNE_PRIME)
+    for i in range(NUM_PERMUTATIONS)
+]
+
+WORD_PATTERN = re.compile(r'\w+|[^\w\s]')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+_sites = {}
+_sites_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Word/punctuation count scaled to roughly match BPE tokenizers."""
+    return int(len(WORD_PATTERN.findall(text)) * 1.1) + 1
+
+
+def set_tokenizer(count_tokens):
+    """Plug in any callable mapping text to a token count."""
+    global _tokenizer
+    with _tokenizer_lock:
+        _tokenizer = count_tokens
+
+
+def get_tokenizer():
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            _tokenizer = estimate_tokens
+            if CHUNK_TOKENIZER in ('auto', 'tiktoken'):
+                try:
+                    import tiktoken
+                    encoding = tiktoken.get_encoding(os.getenv('CHUNK_TIKTOKEN_ENCODING', 'cl100k_base'))
+                    _tokenizer = lambda text: len(encoding.encode(text, disallowed_special=()))
+                except Exception as e:
+                    level = logger.warning if CHUNK_TOKENIZER == 'tiktoken' else logger.debug
+                    level(f"tiktoken unavailable, estimating tokens from words: {e}")
+        return _tokenizer
+
+
+def count_tokens(text):
+    return get_tokenizer()(text)
+
+
+def shingles(words):
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(words):
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big') for s in shingles(words)]
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS)
+
+
+class SiteFingerprints:
+    """Blocks already seen on one site, as exact hashes and MinHash LSH buckets.
+
+    Each entry remembers the page and position it came from, so re-chunking the
+    same page is deterministic: a block is only a duplicate of one seen on a
+    different page, or earlier on the same page.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.buckets = {}
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def is_duplicate(self, block, page_id, position):
+        if LISTING_SIGNAL_PATTERN.search(block):
+            return False
+        words = re.findall(r'\w+', block.lower())
+        origin = (page_id, position)
+        exact_key = hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=16).digest()
+
+        def seen_before(other):
+            return other[0] != page_id or other[1] < position
+
+        with self.lock:
+            first = self.exact.setdefault(exact_key, origin)
+            if seen_before(first):
+                return True
+            if len(words) < MIN_SHINGLE_WORDS:
+                return False
+
+            signature = minhash(words)
+            duplicate = False
+            for band in range(BANDS):
+                key = (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+                for other_signature, other_origin in self.buckets.get(key, ()):
+                    if not seen_before(other_origin):
+                        continue
+                    matches = sum(1 for x, y in zip(signature, other_signature) if x == y)
+                    if matches / NUM_PERMUTATIONS >= DEDUPE_THRESHOLD:
+                        duplicate = True
+                        break
+                if duplicate:
+                    break
+
+            if self.count < MAX_FINGERPRINTS_PER_SITE:
+                self.count += 1
+                for band in range(BANDS):
+                    key = (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+                    self.buckets.setdefault(key, []).append((signature, origin))
+            return duplicate
+
+
+def get_site_fingerprints(site):
+    with _sites_lock:
+        return _sites.setdefault(site, SiteFingerprints())
+
+
+def split_block(block, max_tokens):
+    """Split a block larger than a chunk on sentences, then on words."""
+    pieces = []
+    current = []
+    for sentence in SENTENCE_PATTERN.split(block):
+        candidate = ' '.join(current + [sentence])
+        if current and count_tokens(candidate) > max_tokens:
+            pieces.append(' '.join(current))
+            current = []
+        current.append(sentence)
+    if current:
+        pieces.append(' '.join(current))
+
+    result = []
+    for piece in pieces:
+        if count_tokens(piece) <= max_tokens:
+            result.append(piece)
+            continue
+        words = piece.split()
+        step = max(1, int(len(words) * max_tokens / count_tokens(piece)))
+        result.extend(' '.join(words[i:i + step]) for i in range(0, len(words), step))
+    return result
+
+
+def chunk_text(text, site=None, max_tokens=None, overlap_tokens=None):
+    """Pack the block lines of ``text`` into chunks of at most ``max_tokens``,
+    repeating up to ``overlap_tokens`` of trailing blocks at the start of the
+    next chunk and dropping blocks already seen on ``site``."""
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+
+    blocks = [' '.join(line.split()) for line in text.split('\n')]
+    blocks = [block for block in blocks if block]
+
+    dropped = 0
+    if site and DEDUPE_ENABLED:
+        fingerprints = get_site_fingerprints(site)
+        page_id = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        kept = []
+        for position, block in enumerate(blocks):
+            if fingerprints.is_duplicate(block, page_id, position):
+                dropped += 1
+            else:
+                kept.append(block)
+        blocks = kept
+
+    sized_blocks = []
+    for block in blocks:
+        tokens = count_tokens(block)
+        if tokens > max_tokens:
+            sized_blocks.extend((piece, count_tokens(piece)) for piece in split_block(block, max_tokens))
+        else:
+            sized_blocks.append((block, tokens))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for block, tokens in sized_blocks:
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append('\n'.join(b for b, _ in current))
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current):
+                if overlap_size + previous[1] > overlap_tokens or overlap_size + previous[1] + tokens > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous[1]
+            current = overlap
+            current_tokens = overlap_size
+        current.append((block, tokens))
+        current_tokens += tokens
+    if current:
+        chunks.append('\n'.join(b for b, _ in current))
+
+    if dropped:
+        logger.info(f"Dropped {dropped} of {dropped + len(blocks)} blocks already seen on {site}")
+    return chunks
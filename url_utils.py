@@ -0,0 +1,110 @@
+import re
+import posixpath
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode, quote
+
+ALLOWED_SCHEMES = ('http', 'https')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters that never change page content
+TRACKING_PARAMS = {
+    'gclid', 'gclsrc', 'dclid', 'fbclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid', '_ga', '_gl',
+    'igshid', 'ref_src', 'sessionid', 'session_id', 'sid', 'phpsessid', 'jsessionid', 'sessid',
+    'cfid', 'cftoken', 'aspsessionid',
+}
+TRACKING_PREFIXES = ('utm_', 'hsa_', 'pk_', 'mtm_')
+
+SKIPPED_EXTENSIONS = {
+    'pdf', 'jpg', 'jpeg', 'png', 'gif', 'svg', 'webp', 'avif', 'bmp', 'ico', 'tif', 'tiff',
+    'mp4', 'webm', 'mov', 'avi', 'mp3', 'wav', 'ogg', 'm4a',
+    'zip', 'rar', 'gz', 'tar', '7z', 'exe', 'dmg',
+    'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'csv', 'txt', 'rtf', 'ics', 'vcf',
+    'css', 'js', 'json', 'xml', 'rss', 'woff', 'woff2', 'ttf', 'eot',
+}
+
+PERCENT_ESCAPE_PATTERN = re.compile(r'%[0-9a-f]{2}', re.IGNORECASE)
+PATH_SESSION_PATTERN = re.compile(r';(jsessionid|phpsessid|sid)=[^/?#]*', re.IGNORECASE)
+# Characters left untouched when re-quoting a path (RFC 3986 unreserved, sub-delims, ':' '@' '/' and '%')
+PATH_SAFE_CHARS = "/:@!$&'()*+,;=-._~%"
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def _normalize_path(path):
+    path = PATH_SESSION_PATTERN.sub('', path)
+    if not path:
+        return '/'
+    path = '/' + posixpath.normpath(path).lstrip('/')
+    path = PERCENT_ESCAPE_PATTERN.sub(lambda match: match.group(0).upper(), quote(path, safe=PATH_SAFE_CHARS))
+    return path.rstrip('/') or '/'
+
+
+def normalize_url(url, base=None):
+    """Resolve ``url`` against ``base`` and return its canonical form, or None
+    for non-http(s) links (mailto:, tel:, javascript: ...).
+
+    Fragments and tracking/session parameters are dropped, remaining query
+    parameters are sorted, scheme and host are case-folded, default ports are
+    removed, dot segments are resolved and trailing slashes are stripped.
+    """
+    if not url:
+        return None
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+
+    scheme = parts.scheme.lower()
+    if scheme not in ALLOWED_SCHEMES or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower().rstrip('.')
+    if port and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    )
+    return urlunsplit((scheme, host, _normalize_path(parts.path), urlencode(query), ''))
+
+
+def get_site(url):
+    """Host without a leading 'www.', used to treat www and bare hosts as one site."""
+    try:
+        host = (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        return ''
+    return host[4:] if host.startswith('www.') else host
+
+
+def canonical_key(url):
+    """Scheme- and www-insensitive key for dedupe and cache lookups."""
+    normalized = normalize_url(url)
+    if not normalized:
+        return (url or '').strip()
+    parts = urlsplit(normalized)
+    netloc = parts.netloc[4:] if parts.netloc.startswith('www.') else parts.netloc
+    return urlunsplit(('', netloc, parts.path, parts.query, '')).lstrip('/')
+
+
+def is_same_site(url, base_url):
+    return get_site(url) == get_site(base_url)
+
+
+def should_skip_url(url):
+    """True for links that can never be a listing page (files, media, downloads)."""
+    path = urlsplit(url).path.lower()
+    extension = posixpath.splitext(path)[1].lstrip('.')
+    return extension in SKIPPED_EXTENSIONS
+
+
+def same_page(first, second):
+    return bool(first and second) and canonical_key(first) == canonical_key(second)